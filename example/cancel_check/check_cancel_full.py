@@ -0,0 +1,94 @@
+# check_cancel_full.py
+# 校验 full 模式下取消对比：必须抛出 CompareCancelled，且不在 /dev/shm 留下共享内存段
+# 分别在开始前、相似度矩阵计算期间、矩阵完成后 DP 的不同行取消，并覆盖 incremental_compare
+# 运行（Linux）：python example/cancel_check/check_cancel_full.py [行数]
+import os
+import sys
+import random
+import threading
+
+from pycompare.compare_core.cancel import CompareCancelled
+from pycompare.compare_core.core_qwen import compare_files, incremental_compare, line_hashes
+from pycompare.compare_core.worker_pool import shutdown_compare_pool
+
+SHM_DIR = '/dev/shm'
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta']
+
+def random_lines(count, rng):
+    return [' '.join(rng.choice(WORDS) for _ in range(6)) for _ in range(count)]
+
+class RowCancel:
+    """矩阵全部完成后开始计数，DP 第 rows 次检查时视为已取消（此时已有行视图被引用）"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.armed = False
+        self.checks = 0
+
+    def is_set(self):
+        if not self.armed:
+            return False
+        self.checks += 1
+        return self.checks >= self.rows
+
+    def progress(self, stage, done, total, metrics=None):
+        if stage == 'matrix' and done == total:
+            self.armed = True
+
+def cancel_on_matrix():
+    """返回 (cancel, progress)：progress 第一次汇报矩阵进度时置位 cancel"""
+    cancel = threading.Event()
+
+    def progress(stage, done, total, metrics=None):
+        if stage == 'matrix':
+            cancel.set()
+    return cancel, progress
+
+def expect_cancelled(name, run):
+    before = set(os.listdir(SHM_DIR))
+    try:
+        run()
+    except CompareCancelled:
+        pass
+    else:
+        raise AssertionError(f"{name}: 未抛出 CompareCancelled")
+    leaked = set(os.listdir(SHM_DIR)) - before
+    assert not leaked, f"{name}: 残留共享内存 {sorted(leaked)}"
+    print(f"{name:<32} CompareCancelled，/dev/shm 无残留")
+
+def main(size):
+    rng = random.Random(0)
+    lines1, lines2 = random_lines(size, rng), random_lines(size, rng)
+
+    preset = threading.Event()
+    preset.set()
+    expect_cancelled('full: 开始前已取消', lambda: compare_files(lines1, lines2, mode='full', cancel=preset))
+
+    cancel, progress = cancel_on_matrix()
+    expect_cancelled('full: 矩阵计算期间取消', lambda: compare_files(
+        lines1, lines2, mode='full', cancel=cancel, progress=progress))
+
+    for rows in (2, size // 2, size):
+        cancel = RowCancel(rows)
+        expect_cancelled(f'full: DP 第 {rows} 行取消', lambda: compare_files(
+            lines1, lines2, mode='full', cancel=cancel, progress=cancel.progress))
+
+    old_pairs = compare_files(lines1, lines2, mode='full')
+    edited = lines1[:size // 4] + random_lines(size // 2, rng) + lines1[size // 4 * 3:]
+    cancel = RowCancel(size // 4)
+    expect_cancelled('incremental full: DP 中取消', lambda: incremental_compare(
+        lines1, lines2, old_pairs, edited, lines2, (line_hashes(lines1), line_hashes(lines2)),
+        mode='full', cancel=cancel, progress=cancel.progress))
+
+    # 取消之后同一进程池仍能正常完成对比
+    before = set(os.listdir(SHM_DIR))
+    assert compare_files(lines1, lines2, mode='full') == old_pairs, "取消后重新对比结果不一致"
+    assert not set(os.listdir(SHM_DIR)) - before, "正常对比后残留共享内存"
+    print("取消后重新对比结果一致，/dev/shm 无残留")
+
+if __name__ == "__main__":
+    if not os.path.isdir(SHM_DIR):
+        sys.exit(f"{SHM_DIR} 不存在，此检查只适用于 Linux")
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 600)
+    finally:
+        shutdown_compare_pool(wait=True)
@@ -0,0 +1,62 @@
+# check_detect_encoding.py
+# 校验打开文件时的编码检测：Latin-1 的重音文本不能被当成 GB18030，中文的 GBK/GB18030 文件仍按 gb18030 打开，
+# 并且 MappedLines 的内容与 open(encoding=...).readlines() 一致
+# 运行：python example/encoding_check/check_detect_encoding.py
+import os
+import tempfile
+from pathlib import Path
+
+from pycompare.workspace.file_loader import MappedLines, detect_encoding
+
+LATIN1_SAMPLES = [
+    'Größe\n',
+    'Gr\xf6\xdfe',
+    'élégant\n',
+    'Größe über\n',
+    'señor año\n',
+    'Müller straße\n',
+    'café crème\n',
+    'Informação\nSituação\nNação\nAção\nEdição\n',
+    'Die Größe der Straße ist gemäß Maßstab zu prüfen.\n',
+    'name = "Größe"  # Spaltenname\n',
+]
+
+CHINESE_SAMPLES = [
+    '中文\n',
+    '测试，通过。\n',
+    '# 对比结果\nprint("完成")\n',
+    '使用Python编写\n',
+    '对齐模式: full 计算完整相似度矩阵\n',
+]
+
+def check_file(data, expected):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'sample.txt')
+        with open(path, 'wb') as f:
+            f.write(data)
+        with MappedLines(path) as lines:
+            assert lines.encoding == expected, f"{data[:60]!r}: 检测为 {lines.encoding}，应为 {expected}"
+            with open(path, encoding=lines.encoding, newline=None) as f:
+                assert list(lines) == f.readlines(), f"{data[:60]!r}: 行内容与 readlines 不一致"
+
+def main():
+    for text in LATIN1_SAMPLES:
+        check_file(text.encode('latin-1'), 'latin-1')
+    print(f"Latin-1 样例 {len(LATIN1_SAMPLES)} 个: latin-1")
+
+    for text in CHINESE_SAMPLES:
+        for encoding in ('gbk', 'gb18030'):
+            check_file(text.encode(encoding), 'gb18030')
+        check_file(text.encode('utf-8'), 'utf-8')
+    print(f"中文样例 {len(CHINESE_SAMPLES)} 个: gbk/gb18030 -> gb18030，utf-8 -> utf-8")
+
+    # 仓库中带中文注释的源码
+    sources = [path for path in Path(__file__).resolve().parents[2].joinpath('src').rglob('*.py')
+               if detect_encoding(path.read_bytes()) == 'utf-8']
+    for path in sources:
+        text = path.read_text(encoding='utf-8')
+        assert detect_encoding(text.encode('gb18030')) == 'gb18030', f"{path}: gb18030 未识别"
+    print(f"源码 {len(sources)} 个（含非 ASCII 字符）: 转为 gb18030 后仍识别为 gb18030")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_display_results.py
+# 统计 Workspace.display_results 每显示一行对应的 Tcl 调用次数与耗时（需要图形界面环境）
+# 运行：python example/render_bench/bench_display_results.py [行数]
+import sys
+import time
+import random
+import tkinter as tk
+
+from pycompare.compare_core.core_qwen import compare_files
+from pycompare.workspace.workspace import Workspace
+
+class CallCounter:
+    """包装控件的 tk 解释器对象，按 Text 子命令统计调用次数"""
+    def __init__(self, tkapp):
+        self._tkapp = tkapp
+        self.counts = {}
+
+    def call(self, *args):
+        if len(args) > 1 and isinstance(args[1], str):
+            self.counts[args[1]] = self.counts.get(args[1], 0) + 1
+        return self._tkapp.call(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._tkapp, name)
+
+def make_lines(size, rng):
+    lines1 = [f"value_{k} = compute({k}, {rng.randint(0, 99)})\n" for k in range(size)]
+    lines2 = []
+    for line in lines1:
+        r = rng.random()
+        if r < 0.05:
+            continue
+        lines2.append(line.replace('compute', 'calc') if r < 0.3 else line)
+    return lines1, lines2
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    lines1, lines2 = make_lines(size, random.Random(0))
+    match_pairs = compare_files(lines1, lines2)
+    rows = len(lines1) + len(lines2) - len(match_pairs)
+
+    root = tk.Tk()
+    widgets = [tk.Text(root) for _ in range(4)]
+    counters = []
+    for widget in widgets:
+        widget.tk = CallCounter(widget.tk)
+        counters.append(widget.tk)
+
+    start = time.perf_counter()
+    Workspace.display_results(widgets[0], widgets[1], lines1, lines2, match_pairs, widgets[2], widgets[3])
+    elapsed = time.perf_counter() - start
+
+    names = ("左侧文本区", "右侧文本区", "左侧文件行号", "右侧文件行号")
+    print(f"显示 {rows} 行，耗时 {elapsed:.3f}s")
+    for name, counter in zip(names, counters):
+        total = sum(counter.counts.values())
+        print(f"{name}: Tcl 调用 {total} 次，每行 {total / max(1, rows):.3f} 次，insert {counter.counts.get('insert', 0)} 次")
+    root.destroy()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+行对齐引擎：与相似度计算方式无关的对齐算法
+"""
+from bisect import bisect_left
+from pycompare.compare_core.cancel import check_cancelled
+
+# histogram 风格回退时，参与锚定的行最多允许出现的次数
+MAX_ANCHOR_OCCURRENCE = 64
+
+def _longest_increasing(pairs):
+    """patience 排序求 j 严格递增的最长子序列，pairs 需按 i 递增排列"""
+    tails = []
+    tails_idx = []
+    prev = [-1] * len(pairs)
+    for idx, (i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos:
+            prev[idx] = tails_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tails_idx.append(idx)
+        else:
+            tails[pos] = j
+            tails_idx[pos] = idx
+
+    result = []
+    idx = tails_idx[-1] if tails_idx else -1
+    while idx >= 0:
+        result.append(pairs[idx])
+        idx = prev[idx]
+    result.reverse()
+    return result
+
+def _unique_anchors(keys1, keys2, lo1, hi1, lo2, hi2):
+    """两侧区间内都只出现一次的相同行，取最长递增链作为锚点"""
+    first1 = {}
+    for i in range(lo1, hi1):
+        key = keys1[i]
+        first1[key] = -1 if key in first1 else i
+    first2 = {}
+    for j in range(lo2, hi2):
+        key = keys2[j]
+        if first1.get(key, -1) >= 0:
+            first2[key] = -1 if key in first2 else j
+    pairs = sorted((first1[key], j) for key, j in first2.items() if j >= 0)
+    return _longest_increasing(pairs)
+
+def _histogram_anchors(keys1, keys2, lo1, hi1, lo2, hi2):
+    """没有唯一行时，退而使用两侧出现次数最少的相同行作为锚点"""
+    count1 = {}
+    for i in range(lo1, hi1):
+        count1[keys1[i]] = count1.get(keys1[i], 0) + 1
+    count2 = {}
+    for j in range(lo2, hi2):
+        if keys2[j] in count1:
+            count2[keys2[j]] = count2.get(keys2[j], 0) + 1
+    if not count2:
+        return []
+
+    lowest = min(max(count1[key], count) for key, count in count2.items())
+    if lowest > MAX_ANCHOR_OCCURRENCE:
+        return []
+    candidates = {key for key, count in count2.items() if max(count1[key], count) == lowest}
+
+    positions2 = {}
+    for j in range(lo2, hi2):
+        if keys2[j] in candidates:
+            positions2.setdefault(keys2[j], []).append(j)
+    # 同一 i 的 j 倒序排列，保证最长递增链中每个 i 至多出现一次
+    pairs = [
+        (i, j)
+        for i in range(lo1, hi1) if keys1[i] in candidates
+        for j in reversed(positions2[keys1[i]])
+    ]
+    return _longest_increasing(pairs)
+
+def anchor_regions(keys1, keys2):
+    """
+    patience/histogram 风格锚定。
+    keys1/keys2 为预处理后的行，返回按位置排序的区域列表 (lo1, hi1, lo2, hi2, exact)：
+    exact 为 True 时表示锚定的一对相同行，否则为两锚点之间待模糊匹配的间隙
+    """
+    regions = []
+    stack = [(0, len(keys1), 0, len(keys2))]
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+        # 公共前缀、后缀直接锚定
+        while lo1 < hi1 and lo2 < hi2 and keys1[lo1] == keys2[lo2]:
+            regions.append((lo1, lo1 + 1, lo2, lo2 + 1, True))
+            lo1 += 1
+            lo2 += 1
+        while lo1 < hi1 and lo2 < hi2 and keys1[hi1 - 1] == keys2[hi2 - 1]:
+            hi1 -= 1
+            hi2 -= 1
+            regions.append((hi1, hi1 + 1, hi2, hi2 + 1, True))
+        if lo1 == hi1 and lo2 == hi2:
+            continue
+        if lo1 == hi1 or lo2 == hi2:
+            regions.append((lo1, hi1, lo2, hi2, False))
+            continue
+
+        anchors = (_unique_anchors(keys1, keys2, lo1, hi1, lo2, hi2)
+                   or _histogram_anchors(keys1, keys2, lo1, hi1, lo2, hi2))
+        if not anchors:
+            regions.append((lo1, hi1, lo2, hi2, False))
+            continue
+
+        # 锚点之间的区间继续递归锚定
+        start1, start2 = lo1, lo2
+        for i, j in anchors:
+            regions.append((i, i + 1, j, j + 1, True))
+            if start1 < i or start2 < j:
+                stack.append((start1, i, start2, j))
+            start1, start2 = i + 1, j + 1
+        if start1 < hi1 or start2 < hi2:
+            stack.append((start1, hi1, start2, hi2))
+
+    regions.sort(key=lambda region: (region[0], region[2]))
+    return regions
+
+# 带状对齐中不可达单元格的取值
+_UNREACHABLE = -(1 << 62)
+
+def band_width(keys1, keys2, min_width=16):
+    """
+    估计带宽 k：以两侧唯一相同行构成的递增链偏离比例对角线的最大距离作为编辑密度的估计，
+    至少覆盖两侧行数差；没有唯一相同行时按只在一侧出现的行数估计
+    """
+    m, n = len(keys1), len(keys2)
+    if m == 0 or n == 0:
+        return min_width
+    chain = _unique_anchors(keys1, keys2, 0, m, 0, n)
+    if chain:
+        drift = max(abs(j + 1 - (i + 1) * n // m) for i, j in chain)
+    else:
+        set1, set2 = set(keys1), set(keys2)
+        only1 = sum(1 for key in keys1 if key not in set2)
+        only2 = sum(1 for key in keys2 if key not in set1)
+        drift = (only1 + only2) // 2
+    return max(abs(m - n), drift) + min_width
+
+def _band_bounds(i, m, n, k):
+    """第 i 行（从 1 计）在带内的列范围 [lo, hi]，带中心沿比例对角线移动"""
+    center = i * n // m
+    return max(1, center - k), min(n, center + k)
+
+def _banded_pass(m, n, score, k, min_ratio, cancel=None):
+    # 每行只保存 [lo-1, hi] 列；第 0 行、第 0 列恒为 0
+    bounds = [(1, n)]
+    dp_rows = [[0] * (n + 1)]
+    sim_rows = [None]
+
+    def cell(i, j):
+        if j == 0:
+            return 0
+        lo, hi = bounds[i]
+        if lo <= j <= hi:
+            return dp_rows[i][j - lo + 1]
+        return _UNREACHABLE
+
+    for i in range(1, m + 1):
+        check_cancelled(cancel)
+        lo, hi = _band_bounds(i, m, n, k)
+        prev_lo, prev_hi = bounds[i - 1]
+        prev = dp_rows[i - 1]
+        left = 0 if lo == 1 else _UNREACHABLE
+        row = [left]
+        sims = []
+        for j in range(lo, hi + 1):
+            s = score(i - 1, j - 1)
+            if j - 1 == 0:
+                diag = 0
+            elif prev_lo <= j - 1 <= prev_hi:
+                diag = prev[j - prev_lo]
+            else:
+                diag = _UNREACHABLE
+            up = prev[j - prev_lo + 1] if prev_lo <= j <= prev_hi else _UNREACHABLE
+            left = max(diag + s, up, left)
+            row.append(left)
+            sims.append(s)
+        bounds.append((lo, hi))
+        dp_rows.append(row)
+        sim_rows.append(sims)
+
+    # 回溯，同时检查路径是否贴到带边界
+    aligned = []
+    touched = False
+    i, j = m, n
+    while i > 0 and j > 0:
+        lo, hi = bounds[i]
+        if (j == lo and lo > 1) or (j == hi and hi < n):
+            touched = True
+        value = dp_rows[i][j - lo + 1]
+        ratio = sim_rows[i][j - lo]
+        if abs(value - cell(i - 1, j - 1) - ratio) < min_ratio:
+            if ratio > min_ratio:
+                aligned.append((i - 1, j - 1, ratio))
+            i -= 1
+            j -= 1
+        elif abs(value - cell(i - 1, j)) < min_ratio:
+            i -= 1
+        else:
+            j -= 1
+
+    aligned.reverse()
+    return aligned, touched
+
+def banded_align(m, n, score, k, min_ratio, cancel=None):
+    """
+    带状对齐：只计算比例对角线 ±k 范围内的单元格，时间与内存为 O((n+m)·k)。
+    score(i, j) 按需返回第 i、j 行（从 0 计）的相似度；
+    回溯路径贴到带边界时说明最优解可能在带外，k 翻倍后重算。
+    cancel 被置位时抛出 CompareCancelled。返回 (i, j, ratio) 列表与最终使用的带宽
+    """
+    if m == 0 or n == 0:
+        return [], k
+    k = max(1, k)
+    while True:
+        aligned, touched = _banded_pass(m, n, score, k, min_ratio, cancel)
+        if not touched or k >= max(m, n):
+            return aligned, k
+        k *= 2
+
+# Hirschberg 分治时，子问题单元格数不超过该值即直接做完整 DP 回溯
+HIRSCHBERG_LEAF_CELLS = 1 << 14
+
+def _full_align(i0, i1, j0, j1, score, min_ratio, cancel=None):
+    """子区域 [i0, i1)×[j0, j1) 内的完整 DP 与回溯，回溯规则与 align_matrix 一致"""
+    m, n = i1 - i0, j1 - j0
+    sims = [[score(i0 + i, j0 + j) for j in range(n)] for i in range(m)]
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    for i in range(1, m + 1):
+        check_cancelled(cancel)
+        prev, cur, sim_row = dp[i - 1], dp[i], sims[i - 1]
+        for j in range(1, n + 1):
+            cur[j] = max(prev[j - 1] + sim_row[j - 1], prev[j], cur[j - 1])
+
+    aligned = []
+    i, j = m, n
+    while i > 0 and j > 0:
+        ratio = sims[i - 1][j - 1]
+        if abs(dp[i][j] - dp[i - 1][j - 1] - ratio) < min_ratio:
+            if ratio > min_ratio:
+                aligned.append((i0 + i - 1, j0 + j - 1, ratio))
+            i -= 1
+            j -= 1
+        elif abs(dp[i][j] - dp[i - 1][j]) < min_ratio:
+            i -= 1
+        else:
+            j -= 1
+    return aligned
+
+def _forward_scores(i0, i1, j0, j1, score, cancel=None):
+    """行 [i0, i1) 与列 [j0, j0+c) 的最优得分，c = 0..j1-j0，只保留一行"""
+    width = j1 - j0
+    row = [0] * (width + 1)
+    for i in range(i0, i1):
+        check_cancelled(cancel)
+        prev, row = row, [0] * (width + 1)
+        left = 0
+        for c in range(1, width + 1):
+            left = max(prev[c - 1] + score(i, j0 + c - 1), prev[c], left)
+            row[c] = left
+    return row
+
+def _backward_scores(i0, i1, j0, j1, score, cancel=None):
+    """行 [i0, i1) 与列 [j0+c, j1) 的最优得分，c = 0..j1-j0，自右下角反向计算"""
+    width = j1 - j0
+    row = [0] * (width + 1)
+    for i in range(i1 - 1, i0 - 1, -1):
+        check_cancelled(cancel)
+        prev, row = row, [0] * (width + 1)
+        right = 0
+        for c in range(width - 1, -1, -1):
+            right = max(prev[c + 1] + score(i, j0 + c), prev[c], right)
+            row[c] = right
+    return row
+
+def hirschberg_align(m, n, score, min_ratio, cancel=None):
+    """
+    Hirschberg 分治对齐：与完整 DP 得到相同的最优加权对齐，内存为 O(n+m)。
+    每次取中间行，正向、反向各算一遍只保留一行的得分，在得分和最大的列处切分，
+    两个子问题继续分治；相似度由 score(i, j) 按需重算，不保存矩阵。
+    cancel 被置位时抛出 CompareCancelled
+    """
+    aligned = []
+    stack = [(0, m, 0, n)]
+    while stack:
+        i0, i1, j0, j1 = stack.pop()
+        rows, cols = i1 - i0, j1 - j0
+        if rows == 0 or cols == 0:
+            continue
+        if rows == 1 or rows * cols <= HIRSCHBERG_LEAF_CELLS:
+            aligned.extend(_full_align(i0, i1, j0, j1, score, min_ratio, cancel))
+            continue
+
+        mid = (i0 + i1) // 2
+        upper = _forward_scores(i0, mid, j0, j1, score, cancel)
+        lower = _backward_scores(mid, i1, j0, j1, score, cancel)
+        # 得分相同时取最靠右的列，与完整回溯优先向上移动的规则一致
+        split = max(range(cols + 1), key=lambda c: (upper[c] + lower[c], c))
+        stack.append((mid, i1, j0 + split, j1))
+        stack.append((i0, mid, j0, j0 + split))
+
+    aligned.sort()
+    return aligned
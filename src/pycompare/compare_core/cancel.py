@@ -0,0 +1,11 @@
+"""
+协作式取消：调用方传入 threading.Event（或任何带 is_set() 的对象），
+对比算法在行、区间等粒度上检查，被取消时抛出 CompareCancelled
+"""
+
+class CompareCancelled(Exception):
+    """对比已被取消（例如有新的刷新请求或窗口关闭）"""
+
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise CompareCancelled()
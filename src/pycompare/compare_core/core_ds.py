@@ -1,15 +1,18 @@
 import difflib
 import re
-import os, sys
+import sys
 import uuid
-import psutil
 import numpy as np
 import concurrent.futures
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import lru_cache
 from multiprocessing import shared_memory
 from pycompare.config import COMPARE_AUTOJUNK, JUNK_STR_PATTERN
 from pycompare.config import COMPARE_RESULT_LOG
+from pycompare.config import COMPARE_ALIGN_MODE, COMPARE_BAND_MIN_WIDTH, COMPARE_CHUNK_ROWS
+from pycompare.compare_core.align import band_width, banded_align
+from pycompare.compare_core.similarity import SCALE as RATIO_SCALE, get_cache_size, line_ratio
+from pycompare.compare_core.worker_pool import get_compare_pool, discard_compare_pool, pool_size
 
 import logging
 from pycompare.logging_config import setup_logging
@@ -17,23 +20,10 @@ logger = setup_logging(logging.DEBUG, log_tag=__name__)
 
 class MatcherConfig:
     # 修正后的精度参数
-    SCALE = 1_000_000      # 1e6 (对应1e-6精度)
+    SCALE = RATIO_SCALE    # 1e6 (对应1e-6精度)
     MIN_RATIO = 1          # ratio > 1e-6 → scaled > 1
     DTYPE = np.int32       # 必须使用32位整数
 
-# 预处理缓存优化
-# 根据系统内存动态计算缓存大小
-def get_cache_size():
-    try:
-        total_memory = psutil.virtual_memory().total
-        # 假设使用 1% 的内存作为缓存，可根据实际情况调整
-        cache_memory = total_memory * 0.01
-        # 假设每个缓存项平均占用 100 字节，可根据实际情况调整
-        item_size = 300
-        return max(1000, int(cache_memory / item_size))
-    except:
-        return 10000  # 默认值，当无法获取内存信息时使用
-
 pattern = re.compile(r'['f"{JUNK_STR_PATTERN }"']')
 # 预处理缓存优化
 @lru_cache(maxsize=get_cache_size())
@@ -75,6 +65,8 @@ class DynamicSharedArray:
 class ParallelMatcher:
     SCALE = MatcherConfig.SCALE # 精度缩放因子
     _shared_cache = None
+    keys1 = keys2 = None
+    _job_id = None
     @classmethod
     def init_shared_cache(cls):
         """初始化多进程共享缓存"""
@@ -83,67 +75,62 @@ class ParallelMatcher:
     @classmethod
     def get_ratio(cls, i, j) -> int:
         # 带缓存的相似度计算
-        a = preprocess(cls.lines1[i])
-        b = preprocess(cls.lines2[j])
+        a = cls.keys1[i]
+        b = cls.keys2[j]
         key = (hash(a), hash(b))  # 使用哈希值减少内存占用
         if key not in cls._shared_cache:
-            ratio = difflib.SequenceMatcher(
-                None, a, b, autojunk=COMPARE_AUTOJUNK
-            ).ratio()
-            cls._shared_cache[key] = ratio
-
-        ratio = cls._shared_cache[key]
-        #logger.debug(f"ratio: {ratio} a: {repr(a)} b: {repr(b)}")
-        return int(round(ratio * cls.SCALE))
+            cls._shared_cache[key] = line_ratio(a, b)
+        #logger.debug(f"ratio: {cls._shared_cache[key]} a: {repr(a)} b: {repr(b)}")
+        return cls._shared_cache[key]
     
     @classmethod
     def clear_cache(cls):
         if cls._shared_cache is not None:
             cls._shared_cache.clear()
-    
-    @classmethod
-    def process_row(cls, i, shm_name1, shm_name2, matrix_shm_name, m):
-        shm1 = shm2 = shm_matrix = None
-        cls.lines1 = []
-        cls.lines2 = []
-        cls.init_shared_cache()
+
+    @staticmethod
+    def read_lines(shm_name):
+        """从共享内存解码行表"""
+        shm = shared_memory.SharedMemory(name=shm_name)
         try:
-            # 动态加载数据
-            shm1 = shared_memory.SharedMemory(name=shm_name1)
-            byte_data = bytes(np.ndarray(
-                (shm1.size,), 
-                dtype=np.uint8, 
-                buffer=shm1.buf
-            ))
-            cls.lines1 = byte_data.decode('utf-8').split('\x1E')[:-1]
-            
-            shm2 = shared_memory.SharedMemory(name=shm_name2)
             byte_data = bytes(np.ndarray(
-                (shm2.size,), 
+                (shm.size,), 
                 dtype=np.uint8, 
-                buffer=shm2.buf
+                buffer=shm.buf
             ))
-            cls.lines2 = byte_data.decode('utf-8').split('\x1E')[:-1]
-            
-            shm_matrix = shared_memory.SharedMemory(name=matrix_shm_name)
+            return byte_data.decode('utf-8').split('\x1E')[:-1]
+        finally:
+            shm.close()
+
+    @classmethod
+    def attach(cls, job_id, shm_name1, shm_name2):
+        """每次对比（job_id）在每个进程中只解码、预处理一次两侧行表，比率缓存跨对比保留"""
+        if cls._job_id == job_id:
+            return
+        cls.keys1 = [preprocess(line) for line in cls.read_lines(shm_name1)]
+        cls.keys2 = [preprocess(line) for line in cls.read_lines(shm_name2)]
+        cls._job_id = job_id
+        cls.init_shared_cache()
+        if len(cls._shared_cache) > get_cache_size():
+            cls.clear_cache()
+    
+    @classmethod
+    def process_rows(cls, job_id, shm_name1, shm_name2, matrix_shm_name, n, m, start, end):
+        """计算 [start, end) 行写入结果矩阵"""
+        cls.attach(job_id, shm_name1, shm_name2)
+        shm_matrix = shared_memory.SharedMemory(name=matrix_shm_name)
+        try:
             matrix = np.ndarray(
-                (len(cls.lines1), len(cls.lines2)), 
+                (n, m), 
                 dtype=MatcherConfig.DTYPE,  # float32->MatcherConfig.DTYPE
                 buffer=shm_matrix.buf
             )
-            for j in range(m):
-                matrix[i][j] = ParallelMatcher.get_ratio(i, j)
-
-            return i
+            for i in range(start, end):
+                matrix[i] = [cls.get_ratio(i, j) for j in range(m)]
+            del matrix
         finally:
-            # 清理共享缓存
-            ParallelMatcher.clear_cache()
-            for shm in [shm1, shm2, shm_matrix]:
-                if shm is not None:
-                    try:
-                        shm.close()
-                    except:
-                        pass
+            shm_matrix.close()
+        return end - start
 
 def parallel_sim_matrix(content1, content2):
     arr1 = arr2 = shm_matrix = None
@@ -164,27 +151,31 @@ def parallel_sim_matrix(content1, content2):
         raise
 
     # 动态获取CPU核心数
-    workers = int(os.cpu_count()/2) or 2  # 默认取逻辑核心数，若获取失败则设为2
+    chunk_rows = COMPARE_CHUNK_ROWS or max(1, -(-n // (pool_size() * 4)))  # 每个任务计算的行数
+    job = (
+        uuid.uuid4().hex,
+        arr1.get_reader(),  # 传递共享内存名称
+        arr2.get_reader(),
+        shm_matrix.name,    # 传递结果矩阵名称
+        n, m
+    )
 
     try:
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            futures = [
-                executor.submit(
-                    ParallelMatcher.process_row,
-                    i,
-                    arr1.get_reader(),  # 传递共享内存名称
-                    arr2.get_reader(),
-                    shm_matrix.name,    # 传递结果矩阵名称
-                    m
-                )
-                for i in range(n)
-            ]
-        
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"任务失败: {str(e)}")
+        # 使用常驻进程池，避免每次刷新重新创建进程
+        executor = get_compare_pool()
+        futures = [
+            executor.submit(ParallelMatcher.process_rows, *job, start, min(n, start + chunk_rows))
+            for start in range(0, n, chunk_rows)
+        ]
+    
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except BrokenProcessPool:
+                discard_compare_pool()
+                raise
+            except Exception as e:
+                logger.error(f"任务失败: {str(e)}")
         #return np.ndarray((n, m), dtype=np.float32, buffer=shm_matrix.buf).copy()
         return np.ndarray((n, m), dtype=MatcherConfig.DTYPE, buffer=shm_matrix.buf).copy()
     except Exception as e:
@@ -203,58 +194,97 @@ def parallel_sim_matrix(content1, content2):
             logger.error(f"释放资源时出错: {str(e)}")
             
 
-def compare_files(content1, content2):
-    lines1 = content1 or []
-    lines2 = content2 or []
-    m, n = len(lines1), len(lines2)
-
-    # 并行计算相似度矩阵
-    if lines1 and lines2:
-        sim_matrix = parallel_sim_matrix(lines1, lines2)
-    else:
-        sim_matrix = np.zeros((len(lines1), len(lines2)), dtype=MatcherConfig.DTYPE)
-    #logger.debug(f"sim_matrix: {sim_matrix}")
-
-    # 初始化动态规划表
+def fill_dp(sim_matrix):
+    """
+    向量化填充动态规划表，每次计算一整行：
+    先取 max(左上 + 相似度, 上方)，再沿行做累计最大值即得到 max(..., 左侧)
+    """
+    m, n = sim_matrix.shape
     dp = np.zeros((m+1, n+1), dtype=np.int64)
-
-    # 填充动态规划表
     for i in range(1, m+1):
-        for j in range(1, n+1):
-            dp[i][j] = max(
-                dp[i-1][j-1] + sim_matrix[i-1][j-1],
-                dp[i-1][j],
-                dp[i][j-1]
-            )
+        prev = dp[i-1]
+        candidate = np.maximum(prev[:-1] + sim_matrix[i-1], prev[1:])
+        np.maximum.accumulate(candidate, out=dp[i, 1:])
+    return dp
 
-    # 回溯找到匹配对
-    match_pairs = []
-    i, j = m, n
+def traceback_matrix(dp, sim_matrix):
+    """在数组上回溯匹配对，返回 (i, j, ratio) 列表，按行号递增"""
+    aligned = []
+    i, j = sim_matrix.shape
     while i > 0 and j > 0:
-        ratio = sim_matrix[i-1][j-1]
-        if abs(dp[i][j]-dp[i - 1][j - 1]-ratio) < MatcherConfig.MIN_RATIO:
+        value = dp.item(i, j)
+        ratio = sim_matrix.item(i-1, j-1)
+        if abs(value - dp.item(i-1, j-1) - ratio) < MatcherConfig.MIN_RATIO:
             if ratio > MatcherConfig.MIN_RATIO:
-                # 提取匹配行中相同的部分内容
-                if COMPARE_RESULT_LOG:
-                    matcher = mySequenceMatcher(None, lines1[i - 1], lines2[j - 1])
-                    matches = matcher.get_matching_blocks()
-                    common_content = []
-                    for match in matches:
-                        if match.size > 0:
-                            common_content.append(lines1[i - 1][match.a:match.a + match.size])
-                    common_content = "".join(common_content)
-                    match_pairs.append((i - 1, j - 1, lines1[i - 1], lines2[j - 1], common_content, ratio))
-                else:
-                    match_pairs.append((i - 1, j - 1, "", "", "", ratio))
+                aligned.append((i - 1, j - 1, ratio))
             i -= 1
             j -= 1
-        elif abs(dp[i][j] - dp[i - 1][j]) < MatcherConfig.MIN_RATIO:
+        elif abs(value - dp.item(i-1, j)) < MatcherConfig.MIN_RATIO:
             i -= 1
         else:
             j -= 1
 
     # 反转匹配对列表，使其按行号递增
-    match_pairs.reverse()
+    aligned.reverse()
+    return aligned
+
+def align_matrix(sim_matrix):
+    """在相似度矩阵上做加权对齐，返回 (i, j, ratio) 列表，按行号递增"""
+    sim_matrix = np.asarray(sim_matrix, dtype=MatcherConfig.DTYPE)
+    return traceback_matrix(fill_dp(sim_matrix), sim_matrix)
+
+def banded_compare(lines1, lines2):
+    """只在对角线附近的带内计算相似度并对齐，带宽按行数差与编辑密度自动估计"""
+    keys1 = [preprocess(line) for line in lines1]
+    keys2 = [preprocess(line) for line in lines2]
+    cache = {}
+    def score(i, j):
+        key = (keys1[i], keys2[j])
+        if key not in cache:
+            cache[key] = line_ratio(*key)
+        return cache[key]
+
+    k = band_width(keys1, keys2, COMPARE_BAND_MIN_WIDTH)
+    aligned, k = banded_align(len(keys1), len(keys2), score, k, MatcherConfig.MIN_RATIO)
+    logger.debug(f"banded_compare: {len(keys1)}x{len(keys2)} 带宽 {k}")
+    return aligned
+
+def compare_files(content1, content2, mode=None):
+    """
+    对比两组行，返回 match_pairs 列表。
+    mode: full 全量相似度矩阵；banded 只计算对角线附近带内的单元格。默认取 COMPARE_ALIGN_MODE，
+    本模块不支持的模式按 full 处理
+    """
+    lines1 = content1 or []
+    lines2 = content2 or []
+    m, n = len(lines1), len(lines2)
+    mode = mode or COMPARE_ALIGN_MODE
+
+    if mode == "banded":
+        aligned = banded_compare(lines1, lines2)
+    else:
+        # 并行计算相似度矩阵
+        if lines1 and lines2:
+            sim_matrix = parallel_sim_matrix(lines1, lines2)
+        else:
+            sim_matrix = np.zeros((m, n), dtype=MatcherConfig.DTYPE)
+        #logger.debug(f"sim_matrix: {sim_matrix}")
+        aligned = align_matrix(sim_matrix)
+
+    match_pairs = []
+    for i, j, ratio in aligned:
+        # 提取匹配行中相同的部分内容
+        if COMPARE_RESULT_LOG:
+            matcher = mySequenceMatcher(None, lines1[i], lines2[j])
+            matches = matcher.get_matching_blocks()
+            common_content = []
+            for match in matches:
+                if match.size > 0:
+                    common_content.append(lines1[i][match.a:match.a + match.size])
+            common_content = "".join(common_content)
+            match_pairs.append((i, j, lines1[i], lines2[j], common_content, ratio))
+        else:
+            match_pairs.append((i, j, "", "", "", ratio))
 
     if COMPARE_RESULT_LOG:
         for match in match_pairs:
@@ -262,4 +292,4 @@ def compare_files(content1, content2):
             logger.debug(f"{match[0]}-{match[1]} {repr(match[4])} {match[5]}")
             logger.debug(f"{repr(match[2])}-{repr(match[3])}")
 
-    return match_pairs
\ No newline at end of file
+    return match_pairs
@@ -1,11 +1,11 @@
 import difflib
 import re
-import os
 import sys
 import uuid
+import time
 import psutil
 import concurrent.futures
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import lru_cache
 from multiprocessing import shared_memory
 from array import array
@@ -13,24 +13,34 @@ import struct
 
 from pycompare.config import COMPARE_AUTOJUNK, JUNK_STR_PATTERN
 from pycompare.config import COMPARE_RESULT_LOG
+from pycompare.config import (
+    COMPARE_ALIGN_MODE, COMPARE_ANCHOR_MAX_GAP_CELLS, COMPARE_PARALLEL_MIN_CELLS,
+    COMPARE_BAND_MIN_WIDTH, COMPARE_CHUNK_ROWS,
+    COMPARE_MEMORY_BUDGET_RATIO, COMPARE_PROGRESS_INTERVAL
+)
+from pycompare.compare_core.align import anchor_regions, band_width, banded_align, hirschberg_align
+from pycompare.compare_core.cancel import CompareCancelled, check_cancelled
+from pycompare.compare_core.similarity import SCALE as RATIO_SCALE, get_cache_size, line_ratio
+from pycompare.compare_core.worker_pool import get_compare_pool, discard_compare_pool, pool_size
 
 import logging
 from pycompare.logging_config import setup_logging
 logger = setup_logging(logging.DEBUG, log_tag=__name__)
 
 class MatcherConfig:
-    SCALE = 1_000_000      # 1e6 (对应1e-6精度)
+    SCALE = RATIO_SCALE    # 1e6 (对应1e-6精度)
     MIN_RATIO = 1          # ratio > 1e-6 → scaled > 1
 
-# 缓存大小动态计算
-def get_cache_size():
+# 完整对齐每个单元格的内存估计：int32 相似度 + DP 表中的列表槽位与 int 对象
+MATRIX_CELL_BYTES = 4 + 8 + 28
+
+def fits_memory_budget(m, n) -> bool:
+    """m×n 的相似度矩阵与 DP 表是否在内存预算（可用内存 × COMPARE_MEMORY_BUDGET_RATIO）之内"""
     try:
-        total_memory = psutil.virtual_memory().total
-        cache_memory = total_memory * 0.01
-        item_size = 300
-        return max(1000, int(cache_memory / item_size))
+        budget = psutil.virtual_memory().available * COMPARE_MEMORY_BUDGET_RATIO
     except:
-        return 10000
+        return True
+    return (m + 1) * (n + 1) * MATRIX_CELL_BYTES <= budget
 
 # 预处理正则
 pattern = re.compile(f"[{JUNK_STR_PATTERN}]")
@@ -67,29 +77,93 @@ class DynamicSharedArray:
         if sys.platform != 'win32':
             self.shm.unlink()
 
+class SharedInt32Array:
+    """以 int32 存放到共享内存的整数序列"""
+    def __init__(self, values):
+        data = array('i', values)
+        self.count = len(data)
+        self.shm_name = f"shm_{uuid.uuid4().hex}"
+        self.shm = shared_memory.SharedMemory(
+            create=True,
+            size=max(1, len(data) * data.itemsize),
+            name=self.shm_name
+        )
+        self.shm.buf[:len(data) * data.itemsize] = data.tobytes()
+
+    def get_reader(self) -> str:
+        return self.shm_name
+
+    @staticmethod
+    def read(shm_name, count) -> array:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            data = array('i')
+            data.frombytes(bytes(shm.buf[:count * data.itemsize]))
+            return data
+        finally:
+            shm.close()
+
+    def total(self) -> int:
+        """各元素当前值（可能由其它进程写入）之和"""
+        with self.shm.buf[:self.count * 4].cast('i') as view:
+            return sum(view)
+
+    def release(self):
+        self.shm.close()
+        if sys.platform != 'win32':
+            self.shm.unlink()
+
 class Int32Matrix:
-    """替代 numpy int32 矩阵"""
-    def __init__(self, n, m):
+    """
+    替代 numpy int32 矩阵。传入 shm 时直接以共享内存为存储（零拷贝），
+    用完后调用 release（或用 with）释放共享内存
+    """
+    def __init__(self, n, m, shm=None):
         self.n, self.m = n, m
-        self.data = array('i', [0]) * (n * m)  # i = int32
+        self.shm = shm
+        if shm is None:
+            self.data = array('i', [0]) * (n * m)  # i = int32
+        else:
+            self.data = shm.buf[:n * m * 4].cast('i')
 
     def __setitem__(self, index, value):
         i, j = index
         self.data[i * self.m + j] = value
 
     def __getitem__(self, index):
-        i, j = index
-        return self.data[i * self.m + j]
+        if isinstance(index, tuple):
+            i, j = index
+            return self.data[i * self.m + j]
+        # 单个下标返回整行视图，不复制数据
+        return self.data[index * self.m:(index + 1) * self.m]
 
-    def to_2d_list(self):
-        return [
-            [self.data[i * self.m + j] for j in range(self.m)]
-            for i in range(self.n)
-        ]
+    def release(self):
+        """
+        释放共享内存。仍有行视图被引用时 data.release/close 会抛出 BufferError，
+        此时也要先 unlink，避免段残留在 /dev/shm
+        """
+        if self.shm is None:
+            return
+        shm, self.shm = self.shm, None
+        try:
+            self.data.release()
+            shm.close()
+        finally:
+            if sys.platform != 'win32':
+                shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
 class ParallelMatcher:
     SCALE = MatcherConfig.SCALE
     _shared_cache = None
+    keys1 = keys2 = None
+    ids2 = None
+    _job_id = None
 
     @classmethod
     def init_shared_cache(cls):
@@ -98,76 +172,129 @@ class ParallelMatcher:
 
     @classmethod
     def get_ratio(cls, i, j) -> int:
-        a = preprocess(cls.lines1[i])
-        b = preprocess(cls.lines2[j])
+        a = cls.keys1[i]
+        b = cls.keys2[j]
         key = (hash(a), hash(b))
         if key not in cls._shared_cache:
-            ratio = difflib.SequenceMatcher(None, a, b, autojunk=COMPARE_AUTOJUNK).ratio()
-            cls._shared_cache[key] = ratio
-        return int(round(cls._shared_cache[key] * cls.SCALE))
+            cls._shared_cache[key] = line_ratio(a, b)
+        return cls._shared_cache[key]
 
     @classmethod
     def clear_cache(cls):
         if cls._shared_cache is not None:
             cls._shared_cache.clear()
 
-    @classmethod
-    def process_row(cls, i, shm_name1, shm_name2, matrix_shm_name, m):
-        shm1 = shm2 = shm_matrix = None
-        cls.lines1 = []
-        cls.lines2 = []
-        cls.init_shared_cache()
+    @staticmethod
+    def read_lines(shm_name):
+        shm = shared_memory.SharedMemory(name=shm_name)
         try:
-            # 读取 lines1
-            shm1 = shared_memory.SharedMemory(name=shm_name1)
-            mv = memoryview(shm1.buf)
-            byte_data = bytes(mv)
-            cls.lines1 = byte_data.decode('utf-8').split('\x1E')[:-1]
-            del mv
+            return bytes(shm.buf).decode('utf-8').split('\x1E')[:-1]
+        finally:
+            shm.close()
 
-            # 读取 lines2
-            shm2 = shared_memory.SharedMemory(name=shm_name2)
-            mv = memoryview(shm2.buf)
-            byte_data = bytes(mv)
-            cls.lines2 = byte_data.decode('utf-8').split('\x1E')[:-1]
-            del mv
+    @classmethod
+    def attach(cls, job_id, shm_name1, shm_name2, ids_shm_name, m):
+        """
+        常驻进程池中的进程会处理多次对比：每次对比（job_id）只读取一次两侧去重后的行表
+        和右侧行号到行 ID 的映射，比率缓存跨对比保留，超过容量时清空
+        """
+        if cls._job_id == job_id:
+            return
+        cls.keys1 = cls.read_lines(shm_name1)
+        cls.keys2 = cls.read_lines(shm_name2)
+        cls.ids2 = SharedInt32Array.read(ids_shm_name, m)
+        cls._job_id = job_id
+        cls.init_shared_cache()
+        if len(cls._shared_cache) > get_cache_size():
+            cls.clear_cache()
 
-            # 写入结果矩阵
-            shm_matrix = shared_memory.SharedMemory(name=matrix_shm_name)
-            # 使用 memoryview 操作原始 buffer
-            mv = memoryview(shm_matrix.buf)
-            # 两种写入方案
-            # 方案1：行批量写入。效率更高，占用内存更大
-            row_data = [cls.get_ratio(i, j) for j in range(m)]
-            packed = struct.pack(f'{m}i', *row_data)
-            offset = i * m * 4
-            mv[offset:offset + m*4] = packed
-            # 方案2：逐个写入
-            """
-            for j in range(m):
-                ratio = cls.get_ratio(i, j)
-                # 计算偏移：第 i 行，第 j 列
-                offset = i * m * 4 + j * 4  # 每个 int32 占 4 字节
-                struct.pack_into('i', mv, offset, ratio)
-            """
-
-            return i
+    @classmethod
+    def process_rows(cls, job_id, shm_name1, shm_name2, ids_shm_name, matrix_shm_name, cancel_shm_name,
+                     progress_shm_name, m, slot, groups):
+        """
+        groups 为 (左侧行 ID, 使用该 ID 的行号列表)。每个 ID 只对右侧去重后的行计算一次，
+        再按右侧行 ID 展开成整行，写入所有相同内容的行。
+        每组开始前检查取消标记（cancel_shm_name 首字节非 0），已取消则提前返回；
+        每组完成后把本任务已写入的行数写到进度数组（progress_shm_name）的第 slot 项
+        """
+        cls.attach(job_id, shm_name1, shm_name2, ids_shm_name, m)
+        cancel_shm = shared_memory.SharedMemory(name=cancel_shm_name)
+        progress_shm = shared_memory.SharedMemory(name=progress_shm_name)
+        shm_matrix = shared_memory.SharedMemory(name=matrix_shm_name)
+        mv = shm_matrix.buf
+        rows_done = 0
+        try:
+            for u, rows in groups:
+                if cancel_shm.buf[0]:
+                    break
+                distinct = [cls.get_ratio(u, v) for v in range(len(cls.keys2))]
+                packed = struct.pack(f'{m}i', *[distinct[v] for v in cls.ids2])
+                for i in rows:
+                    offset = i * m * 4
+                    mv[offset:offset + m*4] = packed
+                rows_done += len(rows)
+                struct.pack_into('i', progress_shm.buf, slot * 4, rows_done)
         finally:
             del mv
-            cls.clear_cache()
-            for shm in [shm1, shm2, shm_matrix]:
-                if shm is not None:
-                    try:
-                        shm.close()
-                    except:
-                        logger.warnings(f"释放资源时出错: {str(e)}")
-
-def parallel_sim_matrix(content1, content2):
-    arr1 = arr2 = shm_matrix = None
+            shm_matrix.close()
+            cancel_shm.close()
+            progress_shm.close()
+        return rows_done
+
+def intern_lines(lines):
+    """预处理后按内容分配整数 ID，返回 (每行的 ID, 去重后的行)"""
+    index = {}
+    ids = array('i')
+    for line in lines:
+        ids.append(index.setdefault(preprocess(line), len(index)))
+    return ids, list(index)
+
+def matrix_metrics(rows_done, n, m, distinct, chunks, started) -> dict:
+    """
+    相似度矩阵的进度指标，供状态栏显示与性能分析：
+    已完成行数/总行数、已写入单元格数、耗时、每秒单元格数、预计剩余秒数（尚无进展时为 None）、
+    去重后需计算的行对数、任务数与进程数
+    """
+    elapsed = time.perf_counter() - started
+    cells_per_sec = rows_done * m / elapsed if elapsed > 0 else 0.0
+    eta = (n - rows_done) * m / cells_per_sec if cells_per_sec else None
+    return {
+        'rows_done': rows_done,
+        'rows_total': n,
+        'cells_done': rows_done * m,
+        'elapsed': elapsed,
+        'cells_per_sec': cells_per_sec,
+        'eta': eta,
+        'distinct_pairs': distinct,
+        'chunks': chunks,
+        'workers': pool_size()
+    }
+
+def parallel_sim_matrix(content1, content2, cancel=None, progress=None):
+    """
+    用常驻进程池计算相似度矩阵。cancel 被置位时通过共享内存中的取消标记通知子进程
+    在下一组行之前停止，取消尚未开始的任务并抛出 CompareCancelled。
+    子进程每完成一组行就写入共享的进度数组，父进程每 COMPARE_PROGRESS_INTERVAL 秒汇总一次，
+    有新进展时调用 progress('matrix', 已完成行数, 总行数, metrics)，metrics 见 matrix_metrics
+    """
+    arr1 = arr2 = ids2_shm = cancel_flag = progress_rows = shm_matrix = None
+    n, m = len(content1), len(content2)
+    ids1, uniq1 = intern_lines(content1)
+    ids2, uniq2 = intern_lines(content2)
+    rows_of = [[] for _ in uniq1]
+    for i, u in enumerate(ids1):
+        rows_of[u].append(i)
+    distinct = len(uniq1) * len(uniq2)
+    logger.debug(
+        f"相似度矩阵 {n}x{m}={n * m} 单元格，去重后 {len(uniq1)}x{len(uniq2)}={distinct} 对，"
+        f"需计算 {distinct / max(1, n * m):.1%}"
+    )
+
     try:
-        arr1 = DynamicSharedArray(content1)
-        arr2 = DynamicSharedArray(content2)
-        n, m = len(content1), len(content2)
+        arr1 = DynamicSharedArray(uniq1)
+        arr2 = DynamicSharedArray(uniq2)
+        ids2_shm = SharedInt32Array(ids2)
+        cancel_flag = SharedInt32Array([0])
 
         # 创建结果矩阵共享内存（每个 int32 占 4 字节）
         matrix_size = n * m * 4
@@ -181,100 +308,243 @@ def parallel_sim_matrix(content1, content2):
         logger.error(f"初始化共享内存失败: {str(e)}")
         raise
 
-    workers = max(2, os.cpu_count() // 2)
+    groups = list(enumerate(rows_of))
+    chunk_rows = COMPARE_CHUNK_ROWS or max(1, -(-len(groups) // (pool_size() * 4)))
+    chunks = [groups[start:start + chunk_rows] for start in range(0, len(groups), chunk_rows)]
 
     try:
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            futures = [
-                executor.submit(
-                    ParallelMatcher.process_row,
-                    i,
-                    arr1.get_reader(),
-                    arr2.get_reader(),
-                    shm_matrix.name,
-                    m
-                )
-                for i in range(n)
-            ]
-            for future in concurrent.futures.as_completed(futures):
+        progress_rows = SharedInt32Array([0] * len(chunks))
+        job = (uuid.uuid4().hex, arr1.get_reader(), arr2.get_reader(), ids2_shm.get_reader(),
+               shm_matrix.name, cancel_flag.get_reader(), progress_rows.get_reader(), m)
+        executor = get_compare_pool()
+        started = time.perf_counter()
+        futures = [
+            executor.submit(ParallelMatcher.process_rows, *job, slot, chunk)
+            for slot, chunk in enumerate(chunks)
+        ]
+        rows_done = 0
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, timeout=COMPARE_PROGRESS_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
                 try:
                     future.result()
+                except BrokenProcessPool:
+                    discard_compare_pool()
+                    raise
                 except Exception as e:
                     logger.error(f"任务失败: {str(e)}")
-
-        # 从共享内存读取结果
-        mv = memoryview(shm_matrix.buf)
-        sim_matrix = Int32Matrix(n, m)
-        fmt = f'{n * m}i'
-        data = struct.unpack(fmt, mv[:n * m * 4])
-        for i in range(n):
-            for j in range(m):
-                sim_matrix[i, j] = data[i * m + j]
-
-        return sim_matrix.to_2d_list()  # 返回二维列表
+            rows = progress_rows.total()
+            if progress and rows > rows_done:
+                progress('matrix', rows, n, matrix_metrics(rows, n, m, distinct, len(chunks), started))
+            rows_done = rows
+            if pending and cancel is not None and cancel.is_set():
+                cancel_flag.shm.buf[0] = 1
+                for future in pending:
+                    future.cancel()
+                raise CompareCancelled()
+
+        logger.debug(f"相似度矩阵计算完成: {matrix_metrics(rows_done, n, m, distinct, len(chunks), started)}")
+        # 结果矩阵直接以共享内存为存储交给 DP，由调用方在回溯结束后释放
+        return Int32Matrix(n, m, shm_matrix)
 
     except Exception as e:
-        logger.error(f"并行计算相似度矩阵时出错: {str(e)}")
+        if not isinstance(e, CompareCancelled):
+            logger.error(f"并行计算相似度矩阵时出错: {str(e)}")
+        try:
+            shm_matrix.close()
+            if sys.platform != 'win32':
+                shm_matrix.unlink()
+        except Exception as e:
+            logger.error(f"释放资源时出错: {str(e)}")
         raise
     finally:
         try:
-            del mv
-            for resource in [arr1, arr2]:
+            for resource in [arr1, arr2, ids2_shm, cancel_flag, progress_rows]:
                 if resource is not None:
                     resource.release()
-            if shm_matrix is not None:
-                shm_matrix.close()
-                if sys.platform != 'win32':
-                    shm_matrix.unlink()
         except Exception as e:
             logger.error(f"释放资源时出错: {str(e)}")
 
-def compare_files(content1, content2):
+def make_scorer(keys1, keys2, max_cache=None):
+    """
+    按需计算第 i、j 行（预处理后）相似度的打分函数，相同行对只计算一次。
+    max_cache 限制缓存的行对数，超过时清空，用于不能占用 O(n·m) 内存的场景
+    """
+    cache = {}
+    def score(i, j):
+        key = (keys1[i], keys2[j])
+        ratio = cache.get(key)
+        if ratio is None:
+            if max_cache is not None and len(cache) >= max_cache:
+                cache.clear()
+            ratio = cache[key] = line_ratio(*key)
+        return ratio
+    return score
+
+def serial_sim_matrix(content1, content2, cancel=None):
+    """在当前进程内计算相似度矩阵，用于小区域，避免进程池开销"""
+    score = make_scorer(
+        [preprocess(line) for line in content1],
+        [preprocess(line) for line in content2]
+    )
+    n = len(content2)
+    matrix = []
+    for i in range(len(content1)):
+        check_cancelled(cancel)
+        matrix.append([score(i, j) for j in range(n)])
+    return matrix
+
+def align_matrix(sim_matrix, m, n, cancel=None):
+    """
+    在相似度矩阵上做加权对齐的动态规划，返回 (i, j, ratio) 列表，按行号递增。
+    每行检查一次 cancel，被置位时抛出 CompareCancelled
+    """
+    # 动态规划表（list of list）
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+
+    # sim_row 可能是共享内存上的行视图：异常（如取消）的 traceback 会保留本帧局部变量，
+    # 视图不释放则调用方无法关闭共享内存，因此无论是否异常都在 finally 中丢弃
+    prev = cur = sim_row = None
+    aligned = []
+    try:
+        for i in range(1, m + 1):
+            check_cancelled(cancel)
+            prev, cur, sim_row = dp[i-1], dp[i], sim_matrix[i-1]
+            for j in range(1, n + 1):
+                cur[j] = max(
+                    prev[j-1] + sim_row[j-1],
+                    prev[j],
+                    cur[j-1]
+                )
+
+        # 回溯
+        i, j = m, n
+        while i > 0 and j > 0:
+            ratio = sim_matrix[i-1][j-1]
+            if abs(dp[i][j] - dp[i-1][j-1] - ratio) < MatcherConfig.MIN_RATIO:
+                if ratio > MatcherConfig.MIN_RATIO:
+                    aligned.append((i-1, j-1, ratio))
+                i -= 1
+                j -= 1
+            elif abs(dp[i][j] - dp[i-1][j]) < MatcherConfig.MIN_RATIO:
+                i -= 1
+            else:
+                j -= 1
+    finally:
+        del prev, cur, sim_row
+
+    aligned.reverse()
+    return aligned
+
+def anchor_align(lines1, lines2, cancel=None, progress=None):
+    """
+    先锚定完全相同的行，只在锚点之间的间隙内计算相似度并对齐。
+    对齐间隙期间每 COMPARE_PROGRESS_INTERVAL 秒至多调用一次 progress('align', 左侧已处理行数, 左侧总行数)
+    """
+    keys1 = [preprocess(line) for line in lines1]
+    keys2 = [preprocess(line) for line in lines2]
+
+    aligned = []
+    anchors = gaps = linear = 0
+    last_report = time.perf_counter()
+    for lo1, hi1, lo2, hi2, exact in anchor_regions(keys1, keys2):
+        check_cancelled(cancel)
+        if exact:
+            aligned.append((lo1, lo2, MatcherConfig.SCALE))
+            anchors += 1
+            continue
+
+        m, n = hi1 - lo1, hi2 - lo2
+        if m == 0 or n == 0:
+            continue
+        gaps += 1
+        sub1, sub2 = lines1[lo1:hi1], lines2[lo2:hi2]
+        if m * n > COMPARE_ANCHOR_MAX_GAP_CELLS or not fits_memory_budget(m, n):
+            # 间隙过大且没有可用锚点，不建相似度矩阵，改用 linear 分治对齐
+            logger.debug(f"间隙 {lo1}-{hi1}/{lo2}-{hi2} 过大({m}x{n})，改用 linear 分治对齐")
+            linear += 1
+            gap_aligned = linear_align(sub1, sub2, cancel)
+        elif m * n >= COMPARE_PARALLEL_MIN_CELLS:
+            with parallel_sim_matrix(sub1, sub2, cancel) as sim_matrix:
+                gap_aligned = align_matrix(sim_matrix, m, n, cancel)
+        else:
+            gap_aligned = align_matrix(serial_sim_matrix(sub1, sub2, cancel), m, n, cancel)
+        aligned.extend((lo1 + i, lo2 + j, ratio) for i, j, ratio in gap_aligned)
+        # 小间隙很多时逐个汇报会让主线程忙于处理进度消息，按时间节流
+        if progress and time.perf_counter() - last_report >= COMPARE_PROGRESS_INTERVAL:
+            last_report = time.perf_counter()
+            progress('align', hi1, len(lines1))
+
+    logger.debug(f"anchor_align: 锚点 {anchors} 个，模糊匹配间隙 {gaps} 个，其中 linear 对齐 {linear} 个")
+    return aligned
+
+def banded_compare(lines1, lines2, cancel=None):
+    """只在对角线附近的带内计算相似度并对齐，带宽按行数差与编辑密度自动估计"""
+    keys1 = [preprocess(line) for line in lines1]
+    keys2 = [preprocess(line) for line in lines2]
+    k = band_width(keys1, keys2, COMPARE_BAND_MIN_WIDTH)
+    aligned, k = banded_align(len(keys1), len(keys2), make_scorer(keys1, keys2), k, MatcherConfig.MIN_RATIO, cancel)
+    logger.debug(f"banded_compare: {len(keys1)}x{len(keys2)} 带宽 {k}")
+    return aligned
+
+def linear_align(lines1, lines2, cancel=None):
+    """Hirschberg 分治对齐：结果与 full 相同的最优对齐，不保存相似度矩阵与 DP 表"""
+    keys1 = [preprocess(line) for line in lines1]
+    keys2 = [preprocess(line) for line in lines2]
+    score = make_scorer(keys1, keys2, max_cache=get_cache_size())
+    logger.debug(f"linear_align: {len(keys1)}x{len(keys2)}")
+    return hirschberg_align(len(keys1), len(keys2), score, MatcherConfig.MIN_RATIO, cancel)
+
+def compare_files(content1, content2, mode=None, cancel=None, progress=None):
+    """
+    对比两组行，返回 match_pairs: (i, j, line1, line2, common, ratio) 列表。
+    mode: full 全量相似度矩阵；anchor 先锚定相同行再对间隙做模糊匹配；
+    banded 只计算对角线附近带内的单元格；linear 分治对齐，内存 O(n+m)；
+    auto 在 m×n 不超过 COMPARE_ANCHOR_MAX_GAP_CELLS 时为 full，否则为 anchor。
+    默认取 COMPARE_ALIGN_MODE；full 超出内存预算时自动改用 linear。
+    cancel 为 threading.Event 等带 is_set() 的对象，被置位后对比尽快停止并抛出 CompareCancelled。
+    progress(stage, done, total, metrics=None) 报告进度：stage 为 matrix（相似度矩阵已完成的行，
+    附带 matrix_metrics 指标）或 align（已对齐的行），对齐结束时报告 ('align', m, m)
+    """
     lines1 = content1 or []
     lines2 = content2 or []
     m, n = len(lines1), len(lines2)
-
-    if lines1 and lines2:
-        sim_matrix = parallel_sim_matrix(lines1, lines2)
+    mode = mode or COMPARE_ALIGN_MODE
+    if mode == "auto":
+        mode = "full" if m * n <= COMPARE_ANCHOR_MAX_GAP_CELLS else "anchor"
+    if mode == "full" and not fits_memory_budget(m, n):
+        logger.warning(f"{m}x{n} 的相似度矩阵超出内存预算，改用 linear 分治对齐")
+        mode = "linear"
+
+    if mode == "anchor":
+        aligned = anchor_align(lines1, lines2, cancel, progress)
+    elif mode == "banded":
+        aligned = banded_compare(lines1, lines2, cancel)
+    elif mode == "linear":
+        aligned = linear_align(lines1, lines2, cancel)
     else:
-        sim_matrix = [[0] * n for _ in range(m)]
-
-    # 动态规划表（list of list）
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
+        # 共享内存中的相似度矩阵在回溯结束后立即释放
+        with (parallel_sim_matrix(lines1, lines2, cancel, progress) if lines1 and lines2
+              else Int32Matrix(m, n)) as sim_matrix:
+            aligned = align_matrix(sim_matrix, m, n, cancel)
+    if progress:
+        progress('align', m, m)
 
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            dp[i][j] = max(
-                dp[i-1][j-1] + sim_matrix[i-1][j-1],
-                dp[i-1][j],
-                dp[i][j-1]
-            )
-
-    # 回溯
     match_pairs = []
-    i, j = m, n
-    while i > 0 and j > 0:
-        ratio = sim_matrix[i-1][j-1]
-        if abs(dp[i][j] - dp[i-1][j-1] - ratio) < MatcherConfig.MIN_RATIO:
-            if ratio > MatcherConfig.MIN_RATIO:
-                if COMPARE_RESULT_LOG:
-                    matcher = mySequenceMatcher(None, lines1[i-1], lines2[j-1])
-                    matches = matcher.get_matching_blocks()
-                    common_content = ''.join(
-                        lines1[i-1][match.a:match.a + match.size]
-                        for match in matches if match.size > 0
-                    )
-                    match_pairs.append((i-1, j-1, lines1[i-1], lines2[j-1], common_content, ratio))
-                else:
-                    match_pairs.append((i-1, j-1, "", "", "", ratio))
-            i -= 1
-            j -= 1
-        elif abs(dp[i][j] - dp[i-1][j]) < MatcherConfig.MIN_RATIO:
-            i -= 1
+    for i, j, ratio in aligned:
+        if COMPARE_RESULT_LOG:
+            matcher = mySequenceMatcher(None, lines1[i], lines2[j])
+            matches = matcher.get_matching_blocks()
+            common_content = ''.join(
+                lines1[i][match.a:match.a + match.size]
+                for match in matches if match.size > 0
+            )
+            match_pairs.append((i, j, lines1[i], lines2[j], common_content, ratio))
         else:
-            j -= 1
-
-    match_pairs.reverse()
+            match_pairs.append((i, j, "", "", "", ratio))
 
     if COMPARE_RESULT_LOG:
         for match in match_pairs:
@@ -282,4 +552,66 @@ def compare_files(content1, content2):
             logger.debug(f"{match[0]}-{match[1]} {repr(match[4])} {match[5]}")
             logger.debug(f"{repr(match[2])}-{repr(match[3])}")
 
-    return match_pairs
\ No newline at end of file
+    return match_pairs
+
+def line_hashes(lines):
+    """每行原始内容的哈希，用于刷新时快速定位变化的行"""
+    return [hash(line) for line in lines]
+
+def _changed_span(old_hashes, new_hashes):
+    """公共前缀、后缀之外的变化区间，返回 (前缀行数, 后缀行数)"""
+    limit = min(len(old_hashes), len(new_hashes))
+    prefix = 0
+    while prefix < limit and old_hashes[prefix] == new_hashes[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_hashes[-1 - suffix] == new_hashes[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+def incremental_compare(old1, old2, old_pairs, new1, new2, old_hashes=None, mode=None, cancel=None,
+                        progress=None):
+    """
+    增量对比：以上次对比的行内容与 match_pairs 为基准，只重新对齐变化的区间。
+    变化区间向外扩展到最近的完全相同行对（锚点），区间外的 match_pairs 原样保留（后缀按行数差平移）。
+    old_hashes 为上次两侧的 line_hashes，省略时现算。
+    返回 (match_pairs, hashes, splice)，splice = (a1, a2, old_b1, old_b2, new_b1, new_b2)：
+    旧结果中 [a1, old_b1)×[a2, old_b2) 被新内容的 [a1, new_b1)×[a2, new_b2) 替换
+    """
+    hashes1, hashes2 = line_hashes(new1), line_hashes(new2)
+    old_hashes1, old_hashes2 = old_hashes or (line_hashes(old1), line_hashes(old2))
+    prefix1, suffix1 = _changed_span(old_hashes1, hashes1)
+    prefix2, suffix2 = _changed_span(old_hashes2, hashes2)
+    end1, end2 = len(old1) - suffix1, len(old2) - suffix2
+
+    # 前缀：变化点之前的行对，截止到最后一个完全相同的行对
+    head = 0
+    a1 = a2 = 0
+    for k, pair in enumerate(old_pairs):
+        if pair[0] >= prefix1 or pair[1] >= prefix2:
+            break
+        if pair[5] == MatcherConfig.SCALE:
+            head, a1, a2 = k + 1, pair[0] + 1, pair[1] + 1
+
+    # 后缀：变化点之后的行对，从第一个完全相同的行对开始
+    tail = len(old_pairs)
+    b1, b2 = len(old1), len(old2)
+    for k in range(len(old_pairs) - 1, head - 1, -1):
+        pair = old_pairs[k]
+        if pair[0] < end1 or pair[1] < end2:
+            break
+        if pair[5] == MatcherConfig.SCALE:
+            tail, b1, b2 = k, pair[0], pair[1]
+
+    delta1, delta2 = len(new1) - len(old1), len(new2) - len(old2)
+    new_b1, new_b2 = b1 + delta1, b2 + delta2
+    middle = compare_files(new1[a1:new_b1], new2[a2:new_b2], mode, cancel, progress)
+    logger.debug(
+        f"incremental_compare: 保留前缀 {head} 对、后缀 {len(old_pairs) - tail} 对，"
+        f"重新对齐 {new_b1 - a1}x{new_b2 - a2} 行"
+    )
+
+    match_pairs = old_pairs[:head]
+    match_pairs.extend((i + a1, j + a2, *rest) for i, j, *rest in middle)
+    match_pairs.extend((i + delta1, j + delta2, *rest) for i, j, *rest in old_pairs[tail:])
+    return match_pairs, (hashes1, hashes2), (a1, a2, b1, b2, new_b1, new_b2)
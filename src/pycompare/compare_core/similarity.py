@@ -0,0 +1,76 @@
+"""
+两个对比核心共用的行相似度计算：分级上界过滤后才调用 SequenceMatcher.ratio
+"""
+import difflib
+import threading
+import psutil
+from collections import Counter
+from functools import lru_cache
+from pycompare.config import COMPARE_AUTOJUNK, COMPARE_SIMILARITY_FLOOR
+
+# 相似度按该值缩放为整数 (对应1e-6精度)
+SCALE = 1_000_000
+
+# 缓存大小动态计算
+def get_cache_size():
+    try:
+        total_memory = psutil.virtual_memory().total
+        # 假设使用 1% 的内存作为缓存
+        cache_memory = total_memory * 0.01
+        item_size = 300
+        return max(1000, int(cache_memory / item_size))
+    except:
+        return 10000
+
+@lru_cache(maxsize=get_cache_size())
+def char_histogram(text):
+    return Counter(text)
+
+# 每个线程按 b 缓存 SequenceMatcher，复用其对 b 建立的索引（b2j），只替换 a
+_matchers = threading.local()
+
+def _matcher_for(b):
+    cache = getattr(_matchers, 'cache', None)
+    if cache is None or len(cache) > 4096:
+        cache = _matchers.cache = {}
+    matcher = cache.get(b)
+    if matcher is None:
+        matcher = cache[b] = difflib.SequenceMatcher(None, '', b, autojunk=COMPARE_AUTOJUNK)
+    return matcher
+
+def line_ratio(a, b) -> int:
+    """
+    预处理后两行的相似度，按 SCALE 缩放为整数。
+    分级计算：相同行直接为满分；长度上界（real_quick_ratio）、字符直方图上界（quick_ratio）
+    为 0 或低于 COMPARE_SIMILARITY_FLOOR 时直接记 0；只有可能达到下限的行对才计算 ratio，
+    ratio 低于下限同样记 0，保证结果与走到哪一级无关
+    """
+    if a == b:
+        return SCALE
+    total = len(a) + len(b)
+    floor = COMPARE_SIMILARITY_FLOOR * total
+
+    # 长度上界，等同 real_quick_ratio
+    upper = 2 * min(len(a), len(b))
+    if upper == 0 or upper < floor:
+        return 0
+
+    # 字符直方图上界，等同 quick_ratio
+    hist_a, hist_b = char_histogram(a), char_histogram(b)
+    if len(hist_a) > len(hist_b):
+        hist_a, hist_b = hist_b, hist_a
+    common = 0
+    for char, count in hist_a.items():
+        other = hist_b.get(char)
+        if other:
+            common += count if count < other else other
+    upper = 2 * common
+    if upper == 0 or upper < floor:
+        return 0
+
+    matcher = _matcher_for(b)
+    matcher.set_seq1(a)
+    ratio = matcher.ratio()
+    if ratio < COMPARE_SIMILARITY_FLOOR:
+        return 0
+    return int(round(ratio * SCALE))
@@ -0,0 +1,45 @@
+"""
+常驻的对比进程池：首次对比时创建，多次刷新之间复用，窗口销毁时关闭
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pycompare.config import COMPARE_POOL_WORKERS
+
+import logging
+from pycompare.logging_config import setup_logging
+logger = setup_logging(logging.DEBUG, log_tag=__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def pool_size() -> int:
+    """进程数：优先取配置，否则取逻辑核心数的一半，至少 2 个"""
+    return COMPARE_POOL_WORKERS or max(2, (os.cpu_count() or 2) // 2)
+
+def get_compare_pool() -> ProcessPoolExecutor:
+    """获取常驻进程池，不存在时创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=pool_size())
+            logger.debug(f"创建对比进程池，进程数: {pool_size()}")
+        return _pool
+
+def discard_compare_pool():
+    """进程池损坏（如子进程异常退出）时丢弃，下次对比重新创建"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("对比进程池已丢弃")
+
+def shutdown_compare_pool(wait=False):
+    """关闭常驻进程池，取消尚未开始的任务"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+        logger.debug("对比进程池已关闭")
@@ -9,4 +9,62 @@ COMPARE_RESULT_LOG = False
 
 # for compare_core
 COMPARE_AUTOJUNK = False
-JUNK_STR_PATTERN = " \n"
\ No newline at end of file
+JUNK_STR_PATTERN = " \n"
+# 相似度下限：低于该值的行对记为 0（不参与匹配），长度、字符直方图上界低于下限时跳过 SequenceMatcher。
+# 默认 0 保留所有非零相似度，对齐结果不变；设为 0.6（difflib.get_close_matches 的默认 cutoff）时
+# 大部分行对无需计算 ratio，但相似度较低的修改行会显示为删除加新增
+COMPARE_SIMILARITY_FLOOR = 0
+# 对齐模式: full 计算完整相似度矩阵; anchor 先锚定相同行，仅在锚点间隙内做模糊匹配;
+# banded 只计算对角线 ±k 带内的单元格; linear 为 Hirschberg 分治，内存 O(n+m);
+# auto 在行数乘积不超过 COMPARE_ANCHOR_MAX_GAP_CELLS 时用 full，超过时用 anchor。
+# anchor 不保证最优：锚定的相同行可能不在 full 的最优对齐中，随机小文件测试中 40 次对比有 2~4 次
+# 得到总相似度更低的对齐；linear 与 full 结果相同
+COMPARE_ALIGN_MODE = "auto"
+# 相似度矩阵与 DP 表允许占用的可用内存比例，超过时 full/anchor 自动改用 linear 分治对齐
+COMPARE_MEMORY_BUDGET_RATIO = 0.25
+# anchor 模式下单个间隙建相似度矩阵的最大单元格数，超过则改用 linear 分治对齐；
+# 也是 auto 模式从 full 切换到 anchor 的阈值
+COMPARE_ANCHOR_MAX_GAP_CELLS = 4_000_000
+# 单元格数达到该值才使用进程池计算相似度矩阵
+COMPARE_PARALLEL_MIN_CELLS = 250_000
+# banded 模式的最小带宽，实际带宽按行数差与编辑密度估计，回溯贴边时自动加宽
+COMPARE_BAND_MIN_WIDTH = 16
+# 进程池每个任务计算的行数，0 表示按行数与进程数自动分块
+COMPARE_CHUNK_ROWS = 0
+# 常驻对比进程池的进程数，0 表示取逻辑核心数的一半（至少 2）
+COMPARE_POOL_WORKERS = 0
+# 并行计算相似度矩阵时汇报进度（以及检查取消）的间隔，单位秒
+COMPARE_PROGRESS_INTERVAL = 0.2
+
+# for workspace
+# 对比结果显示行数达到该值时使用虚拟滚动：只把可见区域附近的行放入 Text 控件。
+# 虚拟滚动时两侧文本区只读，不能直接编辑后再 F5，因此默认 0 不启用
+VIEW_VIRTUAL_MIN_ROWS = 0
+# 虚拟滚动时可见区域上下额外放入控件的行数
+VIEW_VIRTUAL_MARGIN_ROWS = 200
+# 显示对比结果时每次 insert 调用合并的行数，也是分片显示的最小单位
+VIEW_INSERT_BATCH_ROWS = 200
+# 分片显示对比结果时每片占用主循环的最长时间（毫秒）
+VIEW_RENDER_SLICE_MS = 10
+
+# for file loading
+# 打开文件时依次尝试的编码（无 BOM 且不是纯 ASCII 时），latin-1 可解码任意字节，放在最后兜底
+FILE_ENCODINGS = ("utf-8", "gb18030", "latin-1")
+# 检测编码时每次校验的字节数，也是判断 GB18030 是否像中文时检查的开头字节数
+FILE_DETECT_CHUNK_BYTES = 1 << 20
+# 能按 GB18030 解码时，非 ASCII 字符中常用字（GB2312 字符集）至少占该比例才认为是中文，
+# 否则继续尝试下一个编码（Latin-1 的重音字母常被解码为 GBK 生僻字）
+FILE_GB18030_MIN_COMMON_RATIO = 0.9
+# 同时常用字（不含夹在 ASCII 字母之间的单字）至少要有该数量，少于时按下一个编码处理：
+# 只有一两个重音字母的短 Latin-1 文本（如 Größe）不会被当成 GB18030，代价是只含单个汉字的文件按 Latin-1 打开
+FILE_GB18030_MIN_CHARS = 2
+# 后台加载文件时每次放入文本区的行数
+FILE_INSERT_CHUNK_LINES = 5000
+
+# for search
+# 向前查找时未扫描部分每次扫描的字符数（之后逐次加倍）
+SEARCH_BACKWARD_CHUNK = 1 << 16
+# 每个文本区缓存匹配位置的查询数
+SEARCH_CACHED_QUERIES = 8
+# 全部高亮时每批交给主线程 tag_add 的匹配数
+SEARCH_HIGHLIGHT_BATCH = 2000
@@ -0,0 +1,121 @@
+"""
+对比结果的显示模型：把 match_pairs 展开为显示行，并在 Python 中计算每行的文本片段、标签与合并标记，
+不依赖 Text 控件的状态
+"""
+from bisect import bisect_right
+from pycompare.compare_core.core_qwen import MatcherConfig, mySequenceMatcher
+from pycompare.config import JUNK_STR_PATTERN
+
+LEFT_ARROW = '\u27A1'
+RIGHT_ARROW = '\u2B05'
+
+_junk_chars = set(JUNK_STR_PATTERN)
+
+def build_rows(match_pairs, n1, n2):
+    """
+    按 display_results 的显示顺序展开为显示行 (左行号, 右行号, ratio)：
+    每个行对之前先显示左侧未匹配行，再显示右侧未匹配行；未匹配的一侧行号与 ratio 为 None
+    """
+    rows = []
+    left = right = 0
+    for pair in match_pairs:
+        i, j = pair[0], pair[1]
+        rows.extend((k, None, None) for k in range(left, i))
+        rows.extend((None, k, None) for k in range(right, j))
+        rows.append((i, j, pair[5]))
+        left, right = i + 1, j + 1
+    rows.extend((k, None, None) for k in range(left, n1))
+    rows.extend((None, k, None) for k in range(right, n2))
+    return rows
+
+def is_equal_row(row) -> bool:
+    ratio = row[2]
+    return ratio is not None and abs(ratio - MatcherConfig.SCALE) <= MatcherConfig.MIN_RATIO
+
+def merge_blocks(rows):
+    """连续的非完全相同行组成一个合并块，返回 [(起始行, 结束行)]，行号从 0 计且包含结束行"""
+    blocks = []
+    start = None
+    for k, row in enumerate(rows):
+        if is_equal_row(row):
+            if start is not None:
+                blocks.append((start, k - 1))
+                start = None
+        elif start is None:
+            start = k
+    if start is not None:
+        blocks.append((start, len(rows) - 1))
+    return blocks
+
+def _diff_runs(text, diff_indices):
+    """部分匹配行：相同部分标记 somematch，不同部分再加 linediffer"""
+    if text == '\n':
+        return [text, 'somematch']
+    runs = []
+    start = 0
+    for begin, end in diff_indices:
+        if begin > start:
+            runs += [text[start:begin], 'somematch']
+        if end > begin:
+            runs += [text[begin:end], ('somematch', 'linediffer')]
+        start = end
+    if len(text) > start:
+        runs += [text[start:], 'somematch']
+    return runs
+
+def row_runs(row, lines1, lines2):
+    """
+    一个显示行在左右文本区中的内容，返回 (左侧片段, 右侧片段)，
+    片段为 [文本, 标签, 文本, 标签, ...]，可直接展开为 Text.insert 的参数
+    """
+    i, j, ratio = row
+    if j is None:
+        return [lines1[i], ('uniqline', 'textcontent')], ['\n', ('uniqline', 'spacesimage')]
+    if i is None:
+        return ['\n', ('uniqline', 'spacesimage')], [lines2[j], ('uniqline', 'textcontent')]
+
+    left_text, right_text = lines1[i], lines2[j]
+    if is_equal_row(row):
+        return [left_text, 'equalline'], [right_text, 'equalline']
+
+    matcher = mySequenceMatcher(lambda c: c in _junk_chars, left_text, right_text, process=False)
+    left_diff, right_diff = [], []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'replace' or op == 'delete':
+            left_diff.append((i1, i2))
+        if op == 'replace' or op == 'insert':
+            right_diff.append((j1, j2))
+    return _diff_runs(left_text, left_diff), _diff_runs(right_text, right_diff)
+
+def gutter_runs(rows, blocks, side, start=0, end=None):
+    """
+    文件行号栏 [start, end) 行的内容：合并标记前缀 + 实际行号（填充行为空格），
+    合并块首行为箭头（标签 arrow_merge），中间行为 '| '，末行为 '|_'，只有一行的块只显示箭头。
+    相邻的无标签行合并为一个片段，整段可用一次 insert 放入
+    """
+    end = len(rows) if end is None else end
+    arrow = LEFT_ARROW if side == 'left' else RIGHT_ARROW
+    index = 0 if side == 'left' else 1
+    runs = []
+    plain = []
+    b = max(0, bisect_right(blocks, (start, len(rows))) - 1)
+    for k in range(start, end):
+        while b < len(blocks) and blocks[b][1] < k:
+            b += 1
+        line = rows[k][index]
+        number = ' ' if line is None else line + 1
+        if b < len(blocks) and blocks[b][0] <= k:
+            block_start, block_end = blocks[b]
+            if k == block_start:
+                if plain:
+                    runs += [''.join(plain), ()]
+                    plain = []
+                runs += [f"{arrow}{number}\n", 'arrow_merge']
+                continue
+            prefix = '|_' if k == block_end else '| '
+        else:
+            prefix = '  '
+        plain.append(f"{prefix}{number}\n")
+    if plain:
+        runs += [''.join(plain), ()]
+    return runs
@@ -0,0 +1,207 @@
+from bisect import bisect_left
+from tkinter import TclError
+import tkinter.font as tkfont
+from pycompare.workspace.diff_model import build_rows, merge_blocks, row_runs, gutter_runs
+from pycompare.workspace.document import DocumentModel
+from pycompare.config import VIEW_VIRTUAL_MARGIN_ROWS
+
+import logging
+from pycompare.logging_config import setup_logging
+logger = setup_logging(logging.DEBUG, log_tag=__name__)
+
+VIEW_MATERIALIZED_EVENT = '<<ViewMaterialized>>'
+
+def tag_merge_blocks(fl, blocks, start, end):
+    """
+    文件行号栏中放入的是 [start, end) 行时，为每个合并块添加标签 merge{序号}，
+    只覆盖块在窗口内的部分；先删除旧的合并块标签
+    """
+    tags = [tag for tag in fl.tag_names() if tag.startswith('merge')]
+    if tags:
+        fl.tag_delete(*tags)
+    first = max(0, bisect_left(blocks, (start,)) - 1)
+    for n in range(first, len(blocks)):
+        block_start, block_end = blocks[n]
+        if block_start >= end:
+            break
+        if block_end < start:
+            continue
+        fl.tag_add(f"merge{n + 1}",
+                   f"{max(block_start, start) - start + 1}.0",
+                   f"{min(block_end, end - 1) - start + 1}.end")
+
+class VirtualDiffView:
+    """
+    虚拟滚动的对比结果视图：对齐结果保存在 Python 中，文本区、行号栏、文件行号栏只放入
+    可见区域及上下 VIEW_VIRTUAL_MARGIN_ROWS 行，滚动接近边缘时平移窗口重新放入。
+    滚动条的位置按整个模型的行数换算。
+    视图存在期间两侧的文档模型冻结为完整的原始内容。
+    每次放入窗口后在两侧文本区产生 VIEW_MATERIALIZED_EVENT，查找等据此重新添加窗口内的标签
+    """
+    def __init__(self, text_areas, line_numbers, flines, lines1, lines2, match_pairs):
+        self.text_areas = text_areas
+        self.line_numbers = line_numbers
+        self.flines = flines
+        self.widgets = (*text_areas, *line_numbers, *flines)
+        self.lines1, self.lines2 = lines1, lines2
+        self.rows = build_rows(match_pairs, len(lines1), len(lines2))
+        self.blocks = merge_blocks(self.rows)
+        self.start = self.end = self.top = 0
+        self._runs_cache = {}
+        self._display_texts = {}
+        for side, (area, lines) in enumerate(zip(text_areas, (lines1, lines2))):
+            document = DocumentModel.of(area)
+            if document:
+                document.freeze(lines, lambda side=side: self.display_text(side))
+
+    @property
+    def total(self):
+        return len(self.rows)
+
+    def page_rows(self) -> int:
+        """文本区一屏可显示的行数"""
+        area = self.text_areas[0]
+        try:
+            linespace = tkfont.nametofont(area.cget('font')).metrics('linespace')
+        except TclError:
+            linespace = 16
+        return max(1, area.winfo_height() // max(1, linespace))
+
+    def display_text(self, side) -> str:
+        """
+        一侧（0 左，1 右）全部显示行的文本，与全部行都放入文本区时的 get('1.0', 'end-1c') 一致，
+        其中的 '行.列' 即模型中的显示行
+        """
+        text = self._display_texts.get(side)
+        if text is None:
+            lines = (self.lines1, self.lines2)[side]
+            text = self._display_texts[side] = ''.join(
+                '\n' if row[side] is None else lines[row[side]] for row in self.rows)
+        return text
+
+    def to_widget(self, index) -> str | None:
+        """模型中的 '行.列' 在当前窗口中的控件索引，不在窗口内时返回 None"""
+        line, col = str(index).split('.')
+        line = int(line) - self.start
+        if 1 <= line <= self.end - self.start:
+            return f"{line}.{col}"
+        return None
+
+    def from_widget(self, index) -> str:
+        """控件索引对应的模型中的 '行.列'"""
+        line, col = str(index).split('.')
+        return f"{int(line) + self.start}.{col}"
+
+    def reveal(self, line):
+        """把模型中的第 line 行（从 1 计）滚动到可见区域中部"""
+        self.show(line - 1 - self.page_rows() // 2)
+
+    def _row_runs(self, k):
+        runs = self._runs_cache.get(k)
+        if runs is None:
+            if len(self._runs_cache) > 8 * VIEW_VIRTUAL_MARGIN_ROWS:
+                self._runs_cache.clear()
+            runs = self._runs_cache[k] = row_runs(self.rows[k], self.lines1, self.lines2)
+        return runs
+
+    def materialize(self, top):
+        """以 top 行为可见区域顶部，重新放入窗口内的行"""
+        page = self.page_rows()
+        self.start = max(0, top - VIEW_VIRTUAL_MARGIN_ROWS)
+        self.end = min(self.total, top + page + VIEW_VIRTUAL_MARGIN_ROWS)
+
+        left, right = [], []
+        for k in range(self.start, self.end):
+            left_runs, right_runs = self._row_runs(k)
+            left += left_runs
+            right += right_runs
+        numbers = [''.join(f"{k + 1}\n" for k in range(self.start, self.end)), ()]
+        contents = (
+            left, right, numbers, numbers,
+            gutter_runs(self.rows, self.blocks, 'left', self.start, self.end),
+            gutter_runs(self.rows, self.blocks, 'right', self.start, self.end)
+        )
+        for widget, runs in zip(self.widgets, contents):
+            prestate = widget.cget('state')
+            widget.config(state='normal')
+            widget.delete('1.0', 'end')
+            if runs[0]:
+                widget.insert('1.0', *runs)
+            widget.config(state=prestate)
+
+        for fl in self.flines:
+            tag_merge_blocks(fl, self.blocks, self.start, self.end)
+        logger.debug(f"虚拟视图放入第 {self.start + 1}-{self.end} 行，共 {self.total} 行")
+        for area in self.text_areas:
+            try:
+                area.event_generate(VIEW_MATERIALIZED_EVENT)
+            except TclError as e:
+                logger.debug(f"通知窗口已放入失败: {e}")
+
+    def show(self, top):
+        """滚动到以 top 行为顶部，顶部或底部接近窗口边缘时先平移窗口"""
+        page = self.page_rows()
+        top = max(0, min(top, self.total - page))
+        margin = VIEW_VIRTUAL_MARGIN_ROWS // 2
+        if (self.start == self.end
+                or top < self.start or top + page > self.end
+                or (top - self.start < margin and self.start > 0)
+                or (self.end - top - page < margin and self.end < self.total)):
+            self.materialize(top)
+        self.top = top
+        fraction = (top - self.start) / (self.end - self.start + 1)
+        for widget in self.widgets:
+            widget.yview_moveto(fraction)
+
+    def scroll(self, *args):
+        """滚动条命令：moveto 按模型比例定位，scroll 按行或页移动"""
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = self.page_rows() if args[2] == 'pages' else 1
+            top = self.top + int(args[1]) * step
+        else:
+            return
+        self.show(top)
+
+    def _model_fractions(self, first, last):
+        lines = self.end - self.start + 1
+        total = max(1, self.total)
+        return ((self.start + float(first) * lines) / total,
+                min(1.0, (self.start + float(last) * lines) / total))
+
+    def on_widget_scroll(self, first, last):
+        """
+        控件自身滚动（滚轮、光标移动）时调用：同步其它控件，必要时平移窗口，
+        返回按模型换算的滚动条位置
+        """
+        lines = self.end - self.start + 1
+        top = self.start + round(float(first) * lines)
+        if top != self.top:
+            self.show(top)
+            first, last = self.text_areas[0].yview()
+        return self._model_fractions(first, last)
+
+    def yview(self):
+        """按模型换算的 (first, last)"""
+        return self._model_fractions(*self.text_areas[0].yview())
+
+    def detach(self):
+        """不再使用该视图（控件将被重写）：文档模型解除冻结，重新跟随控件"""
+        for area in self.text_areas:
+            document = DocumentModel.of(area)
+            if document:
+                document.thaw()
+
+    def release(self):
+        """退出虚拟显示：文本区放回完整的原始内容并恢复可编辑，清空行号栏"""
+        self.detach()
+        for area, lines in zip(self.text_areas, (self.lines1, self.lines2)):
+            area.config(state='normal')
+            area.delete('1.0', 'end')
+            if lines:
+                area.insert('1.0', ''.join(lines))
+        for widget in (*self.line_numbers, *self.flines):
+            widget.config(state='normal')
+            widget.delete('1.0', 'end')
+            widget.config(state='disabled')
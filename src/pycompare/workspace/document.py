@@ -0,0 +1,308 @@
+"""
+每个文本区对应的文档模型：在 Python 中保存控件中的显示行及每行的填充类型，
+对比、保存直接从模型取文件内容，不再逐行读取控件
+"""
+from bisect import bisect_right
+
+import logging
+from pycompare.logging_config import setup_logging
+logger = setup_logging(logging.DEBUG, log_tag=__name__)
+
+TEXT_CONTENT_TAG = set(['equalline', 'somematch', 'linediffer',
+                    'uniqline', 'textcontent', 'spacesimage',
+                    'invalidfilltext', 'newline'])
+
+# 行的填充类型：None 为文件内容；pad 为对齐填充行（spacesimage）；fill 为末尾的无效填充行（invalidfilltext）
+PAD = 'pad'
+FILL = 'fill'
+# insert 未给出标签时，新字符继承插入点前后字符共有的标签
+INHERIT = 'inherit'
+
+def _line_kind(tags) -> str | None:
+    tags = set(tags)
+    if 'invalidfilltext' in tags:
+        # 只带 invalidfilltext 一个内容标签时才是末尾的无效填充
+        return FILL if not (tags & TEXT_CONTENT_TAG) - {'invalidfilltext'} else PAD
+    if 'spacesimage' in tags:
+        return PAD
+    return None
+
+class DocumentModel:
+    """
+    lines 为控件中的显示行（不含换行符），kinds 为每行的填充类型，二者等长，
+    最后一行对应控件末尾不可删除的换行符之前的内容。
+
+    attach 把控件的 Tcl 命令替换为代理：insert、delete、replace 先在控件上执行，
+    再按解析后的位置同步到模型，因此用户输入、粘贴、撤销和程序写入都会被记录。
+    填充标签被单独增删或执行 edit undo/redo 时模型标记为过期，下次读取时从控件重建一次
+    """
+    def __init__(self, widget=None):
+        self.widget = widget
+        self.lines = ['']
+        self.kinds = [None]
+        self.stale = False
+        # 控件文本每次（可能）变化时递增，查找等缓存据此判断是否失效
+        self.revision = 0
+        # 冻结时（虚拟滚动视图只放入部分行）忽略控件的修改，content 返回 frozen 中的完整内容
+        self.frozen = None
+        self.display = None
+        self._orig = None
+
+    @staticmethod
+    def attach(widget) -> 'DocumentModel':
+        """为 widget 创建文档模型并安装命令代理，模型保存在 widget.__dict__['__document']"""
+        document = DocumentModel(widget)
+        document._orig = f"{widget._w}_document"
+        widget.tk.call('rename', widget._w, document._orig)
+        widget.tk.createcommand(widget._w, document._dispatch)
+        widget.bind('<Destroy>', document._on_destroy, add='+')
+        widget.__dict__['__document'] = document
+        return document
+
+    @staticmethod
+    def of(widget) -> 'DocumentModel | None':
+        return widget.__dict__.get('__document')
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            try:
+                self.widget.tk.deletecommand(self.widget._w)
+            except Exception:
+                pass
+
+    def _call(self, *args):
+        return self.widget.tk.call((self._orig,) + args)
+
+    def _dispatch(self, operation, *args):
+        if self.frozen is not None or operation not in ('insert', 'delete', 'replace', 'tag', 'edit'):
+            return self._call(operation, *args)
+
+        if operation == 'tag':
+            if (args and args[0] in ('add', 'remove', 'delete')
+                    and set(args[1:] if args[0] == 'delete' else args[1:2]) & {'spacesimage', 'invalidfilltext'}
+                    and (len(self.lines) > 1 or self.lines[0])):
+                self.stale = True
+            return self._call(operation, *args)
+        if operation == 'edit':
+            if args and args[0] in ('undo', 'redo'):
+                self.stale = True
+                self.revision += 1
+            return self._call(operation, *args)
+
+        # 禁用状态下 Tk 忽略修改
+        if str(self._call('cget', '-state')) == 'disabled':
+            return self._call(operation, *args)
+
+        # 修改前解析位置，执行成功后再同步到模型
+        self.revision += 1
+        if operation == 'insert':
+            position = self._position(args[0])
+            segments = self._segments(args[1:])
+            self._check_insert(*position[:2], segments)
+            result = self._call(operation, *args)
+            self._insert(*position[:2], segments)
+        elif operation == 'delete':
+            span = self._span(*args[:2])
+            result = self._call(operation, *args)
+            if span:
+                self._check_delete(*span)
+                self._delete(*span)
+        else:
+            span = self._span(*args[:2])
+            segments = self._segments(args[2:])
+            result = self._call(operation, *args)
+            if span:
+                self._check_delete(*span)
+                self._delete(*span)
+                self._check_insert(*span[0], segments)
+                self._insert(*span[0], segments)
+            else:
+                position = self._position(args[0])
+                self._check_insert(*position[:2], segments)
+                self._insert(*position[:2], segments)
+        return result
+
+    def _padded(self, *lines) -> bool:
+        return any(self.kinds[line] is not None for line in lines if 0 <= line < len(self.kinds) - 1)
+
+    def _check_insert(self, line, col, segments):
+        """
+        模型只记录每行换行符的填充类型，不记录行内字符的标签：在填充行的行中插入，
+        或在填充行附近插入继承标签的文本（如用户输入）时，行内字符的标签无法确定，标记为过期
+        """
+        if self._padded(line) and col > 0:
+            self.stale = True
+        elif any(kind == INHERIT for _, kind in segments) and self._padded(line, line - 1):
+            self.stale = True
+
+    def _check_delete(self, start, end):
+        """删除区间的首尾不在行首时会把填充行与其它行的字符拼接到一行，同样标记为过期"""
+        (l1, c1), (l2, c2) = start, end
+        if (c1 > 0 or c2 > 0) and self._padded(l1, l2):
+            self.stale = True
+
+    def _segments(self, args):
+        """insert 的 chars tagList chars tagList ... 参数，返回 [(文本, 其中换行符的填充类型)]"""
+        if len(args) == 1:
+            return [(str(args[0]), INHERIT)]
+        segments = []
+        for k in range(0, len(args), 2):
+            tags = self.widget.tk.splitlist(args[k + 1]) if k + 1 < len(args) else ()
+            segments.append((str(args[k]), _line_kind(tags)))
+        return segments
+
+    def _position(self, index):
+        """解析为 (行, 列, 是否在末尾换行符之后)，行从 0 计，超出内容时截到最后一行行尾"""
+        line, col = map(int, str(self._call('index', index)).split('.'))
+        if line > len(self.lines):
+            return len(self.lines) - 1, len(self.lines[-1]), True
+        return line - 1, min(col, len(self.lines[line - 1])), False
+
+    def _span(self, index1, index2=None):
+        """delete 的删除区间 ((行, 列), (行, 列))，与 Tk 一样不删除末尾的换行符；为空时返回 None"""
+        l1, c1, _ = self._position(index1)
+        if index2 is None:
+            if c1 < len(self.lines[l1]):
+                return (l1, c1), (l1, c1 + 1)
+            return ((l1, c1), (l1 + 1, 0)) if l1 + 1 < len(self.lines) else None
+        l2, c2, beyond = self._position(index2)
+        if (l2, c2) <= (l1, c1):
+            return None
+        if beyond and c1 == 0 and l1 > 0:
+            # 区间延伸到末尾换行符且从行首开始时，Tk 同时删除区间前的换行符
+            l1, c1 = l1 - 1, len(self.lines[l1 - 1])
+        return (l1, c1), (l2, c2)
+
+    def _inherited_kind(self, line, col):
+        """
+        未给出标签时插入的换行符的填充类型：插入点前后的字符都是同类填充行的换行符
+        （插入点在空行行首，且上一行与本行填充类型相同）时继承该类型。
+        模型不记录行内字符的标签，行内文本按不带填充标签处理
+        """
+        if col == 0 and line > 0 and not self.lines[line] and self.kinds[line - 1] == self.kinds[line]:
+            return self.kinds[line]
+        return None
+
+    def _insert(self, line, col, segments):
+        text = self.lines[line]
+        new_lines, new_kinds = [], []
+        current = text[:col]
+        for chars, kind in segments:
+            if kind == INHERIT:
+                kind = self._inherited_kind(line, col)
+            parts = chars.split('\n')
+            for part in parts[:-1]:
+                new_lines.append(current + part)
+                # 接在原有文本（带内容标签）之后的无效填充换行符，与 get_area 一样按填充行处理
+                new_kinds.append(PAD if kind == FILL and not new_lines[:-1] and col > 0 else kind)
+                current = ''
+            current += parts[-1]
+        new_lines.append(current + text[col:])
+        new_kinds.append(self.kinds[line])
+        self.lines[line:line + 1] = new_lines
+        self.kinds[line:line + 1] = new_kinds
+
+    def _delete(self, start, end):
+        (l1, c1), (l2, c2) = start, end
+        kind = self.kinds[l2] if l2 < len(self.lines) - 1 else None
+        if kind == FILL and c1 > 0:
+            kind = PAD
+        self.lines[l1:l2 + 1] = [self.lines[l1][:c1] + self.lines[l2][c2:]]
+        self.kinds[l1:l2 + 1] = [kind]
+        if l1 == len(self.lines) - 1:
+            self.kinds[l1] = None
+        if len(self.lines) == 1 and not self.lines[0]:
+            self.stale = False
+
+    def _tag_bounds(self, tag) -> list[tuple[int, int]]:
+        return [tuple(map(int, str(index).split('.'))) for index in self.widget.tag_ranges(tag)]
+
+    def resync(self):
+        """从控件重建模型：取一次全部文本，填充标签的区间各取一次"""
+        self.lines = self.widget.get('1.0', 'end-1c').split('\n')
+        bounds = {tag: self._tag_bounds(tag) for tag in TEXT_CONTENT_TAG}
+        def tagged(tag, i, line):
+            return (bisect_right(bounds[tag], (i, 0)) % 2 == 1
+                    or bisect_right(bounds[tag], (i, len(line))) % 2 == 1)
+        self.kinds = []
+        for i, line in enumerate(self.lines, 1):
+            if tagged('invalidfilltext', i, line):
+                others = any(tagged(tag, i, line) for tag in TEXT_CONTENT_TAG - {'invalidfilltext'})
+                self.kinds.append(PAD if others else FILL)
+            elif tagged('spacesimage', i, line):
+                self.kinds.append(PAD)
+            else:
+                self.kinds.append(None)
+        self.stale = False
+        logger.debug(f"文档模型已从控件重建，共 {len(self.lines)} 行")
+
+    def text(self) -> str:
+        """控件中的全部文本，与 get('1.0', 'end-1c') 一致（冻结时为控件中的部分行，调用方应直接取控件）"""
+        if self.stale and self.frozen is None:
+            self.resync()
+        return '\n'.join(self.lines)
+
+    def trailing_fill(self) -> int:
+        """末尾连续的无效填充行数，不计第一行和末尾换行符所在的最后一行"""
+        if self.stale and self.frozen is None:
+            self.resync()
+        count = 0
+        for kind in reversed(self.kinds[1:-1]):
+            if kind != FILL:
+                break
+            count += 1
+        return count
+
+    def freeze(self, lines, display=None):
+        """
+        控件只显示部分行期间，以 lines 作为完整内容，忽略控件的修改；
+        display 为返回完整显示文本（全部行都放入控件时的文本）的函数，供查找使用
+        """
+        self.frozen = list(lines)
+        self.display = display
+        self.revision += 1
+
+    def thaw(self):
+        """解除冻结，模型重新跟随控件（调用方随后会清空并重写控件）"""
+        if self.frozen is not None:
+            self.frozen = None
+            self.display = None
+            self.stale = True
+            self.revision += 1
+
+    def copy(self) -> 'DocumentModel':
+        """当前内容的独立副本，可交给后台线程读取"""
+        if self.stale and self.frozen is None:
+            self.resync()
+        document = DocumentModel()
+        document.lines, document.kinds = list(self.lines), list(self.kinds)
+        document.frozen = None if self.frozen is None else list(self.frozen)
+        return document
+
+    def content(self, final_newline=False) -> list[str]:
+        """
+        文件内容（去掉填充行），按行返回，与 Editor.get_area(控件, '1.0', 'end-1c') 一致；
+        final_newline 为 True 时最后一行保留换行符，与 get_area(控件, '1.0', 'end') 一致
+        """
+        if self.frozen is not None:
+            return list(self.frozen)
+        if self.stale:
+            self.resync()
+        content = []
+        last = len(self.lines) - 1
+        for k, (line, kind) in enumerate(zip(self.lines, self.kinds)):
+            if kind is None:
+                text = line if k == last and not final_newline else f"{line}\n"
+            elif line:
+                text = line
+            else:
+                text = None
+            if text is not None:
+                content.append(text)
+            if kind == FILL:
+                break
+        else:
+            if final_newline:
+                # get_area 取到 end 时末尾换行符之后的一行得到空串
+                content.append('')
+        return content
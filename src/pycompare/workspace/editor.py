@@ -1,22 +1,27 @@
+import time
+import queue
+import threading
 from tkinter import *
-from tkinter import messagebox
 from tkinter import filedialog
 from tkinter import TclError
+from bisect import bisect_right
 from pycompare.workspace.events_queue import (
     group_event_decorator,
     update_cursor_position,
     set_event_group
 )
 from pycompare.workspace.file_selector import FileSelector
-from pycompare.config import QUEUE_EVENT_LOG, DEBUG_TAG, GET_AREA_LOG
+from pycompare.workspace.document import DocumentModel, TEXT_CONTENT_TAG
+from pycompare.workspace.file_loader import MappedLines
+from pycompare.config import (
+    QUEUE_EVENT_LOG, DEBUG_TAG, GET_AREA_LOG, FILE_INSERT_CHUNK_LINES, VIEW_RENDER_SLICE_MS
+)
 
 import logging
 from pycompare.logging_config import setup_logging
 logger = setup_logging(logging.DEBUG, log_tag=__name__)
 
-TEXT_CONTENT_TAG = set(['equalline', 'somematch', 'linediffer', 
-                    'uniqline', 'textcontent', 'spacesimage', 
-                    'invalidfilltext', 'newline'])
+FILE_LOAD_EVENT = '<<FileLoadMessage>>'
 
 class Editor:
     class EditorEvent:
@@ -143,56 +148,23 @@ class Editor:
             for area in [text_area, tag_area]:
                 area.__dict__['__modifiedCT'] = 0
             
-            maxtextline =  int(text_area.index('end').split('.')[0])
-            maxtagline = int(tag_area.index('end').split('.')[0])
-            maxlln = int(lln.index('end').split('.')[0])
-            maxrln = int(rln.index('end').split('.')[0])
-            maxlfl = int(lfl.index('end').split('.')[0])
-            maxrfl = int(rfl.index('end').split('.')[0])
-
-            #logger.debug(f"text_area.tag_ranges('invalidfilltext'): {text_area.tag_ranges('invalidfilltext')}")
-            #logger.debug(f"tag_area.tag_ranges('invalidfilltext'): {tag_area.tag_ranges('invalidfilltext')}")
-
-            if False: #MODIFY_REVIEW_LOG:
-                messagebox.showerror(title="错误", message="对比结果显示行数不一致")
-
-            logger.debug("----------------")
-            logger.debug(f"on_compare_end--l_text_area.index('end'): {maxtextline}")
-            logger.debug(f"on_compare_end--r_text_area.index('end'): {maxtagline}")
-            logger.debug(f"on_compare_end--l_line_numbers.index('end'): {maxlln}")
-            logger.debug(f"on_compare_end--r_line_numbers.index('end'): {maxrln}")
-            logger.debug(f"on_compare_end--lfl.index('end'): {maxlfl}")
-            logger.debug(f"on_compare_end--rfl.index('end'): {maxrfl}")
-            logger.debug("----------------")
-
+            # 各控件的行数取自文档模型，末尾缺少的行一次插入
             vs = [text_area, tag_area, lln, rln, lfl, rfl]
-            ls = [maxtextline, maxtagline, maxlln, maxrln, maxlfl, maxrfl]
-            maxline = max([maxtextline, maxtagline, maxlln, maxrln, maxlfl, maxrfl])
-            minline = min([maxtextline, maxtagline, maxlln, maxrln, maxlfl, maxrfl])
-            
-            logger.debug(f"maxline: {maxline} minline: {minline}")
-        
+            ls = [Editor.line_count(v) for v in vs]
+            maxline = max(ls)
+            logger.debug(f"on_compare_end--行数: {ls} maxline: {maxline}")
+
             for v, maxl in zip(vs, ls):
+                if maxl >= maxline:
+                    continue
                 prestate = v.cget('state')
                 if prestate == 'disabled':
                     v.config(state='normal')
-                for i in range(minline, maxline):
-                    if i >= maxl:
-                        #logger.debug(f"i: {i} maxl: {maxl}")
-                        v.insert('end', '\n', 'invalidfilltext')
+                v.insert('end', '\n' * (maxline - maxl), 'invalidfilltext')
                 v.config(state=prestate)
-            
-            logger.debug("----------------")
-            logger.debug(f"on_compare_end--l_text_area.index('end'): {text_area.index('end')}")
-            logger.debug(f"on_compare_end--r_text_area.index('end'): {tag_area.index('end')}")
-            logger.debug(f"on_compare_end--l_line_numbers.index('end'): {lln.index('end')}")
-            logger.debug(f"on_compare_end--r_line_numbers.index('end'): {rln.index('end')}")
-            logger.debug(f"on_compare_end--lfl.index('end'): {lfl.index('end')}")
-            logger.debug(f"on_compare_end--rfl.index('end'): {rfl.index('end')}")
-            logger.debug("----------------")
-
-            text_area.__dict__['__endline'] = int(text_area.index('end').split('.')[0])
-            tag_area.__dict__['__endline'] = int(tag_area.index('end').split('.')[0])
+
+            text_area.__dict__['__endline'] = maxline + 1
+            tag_area.__dict__['__endline'] = maxline + 1
 
             if DEBUG_TAG:
                 import shutil
@@ -281,41 +253,49 @@ class Editor:
         line_numbers.tag_delete(*tuple(line_numbers.tag_names()))
         line_numbers.config(state='disabled')
 
+    @staticmethod
+    def _tag_bounds(text_area, tag) -> list[tuple[int, int]]:
+        """tag 各区间的端点 (行, 列)，按位置排序；位置 p 之前有奇数个端点时 p 处的字符带有该标签"""
+        return [tuple(map(int, str(index).split('.'))) for index in text_area.tag_ranges(tag)]
+
     @staticmethod
     def get_area(text_area, strstart='1.0', strend='end-1c') -> list[str]:
+        """
+        取 strstart 到 strend 之间的文件内容（去掉填充行），按行返回。
+        文本只 get 一次，内容标签的区间各取一次，行首、行尾字符的标签在 Python 中按区间判断
+        """
         content = []
-        
+
         start = text_area.index(strstart)
         end = text_area.index(strend)
 
-        #logger.debug(f"get_area, strstart: {strstart} strend: {strend}")
-        #logger.debug(f"start char: {start.split('.')[1]}")
-        #logger.debug(f"end char: {end.split('.')[1]}")
-    
         if GET_AREA_LOG:
             logger.debug(f"get_area, start: {start} end: {end}")
-        
+
         start_c = int(start.split('.')[1])
         end_c = int(end.split('.')[1])
 
         start = int(start.split('.')[0])
-        end = int(end.split('.')[0])        
-
-        for i in range(start, end+1):
+        end = int(end.split('.')[0])
+
+        lines = text_area.get(f"{start}.0", f"{end}.end").split('\n')
+        # strend 为 end 时最后一行在末尾换行符之后，逐行 get 得到空串
+        lines += [''] * (end - start + 1 - len(lines))
+        bounds = {}
+        def tagged(tag, i, line):
+            # 与逐行的 tag_names(f"{i}.0") + tag_names(f"{i}.end") 等价
+            if tag not in bounds:
+                bounds[tag] = Editor._tag_bounds(text_area, tag)
+            return (bisect_right(bounds[tag], (i, 0)) % 2 == 1
+                    or bisect_right(bounds[tag], (i, len(line))) % 2 == 1)
+
+        for i, line in zip(range(start, end+1), lines):
             lct = None
-            line = text_area.get(f"{i}.0", f"{i}.end")
-            line_tags = set(text_area.tag_names(f"{i}.0")+text_area.tag_names(f"{i}.end"))
-            
-            #logger.debug(f"{i} line_tags: {line_tags} {repr(line)}")
-            #logger.debug(f"set(TEXT_CONTENT_TAG)&line_tags): {set(TEXT_CONTENT_TAG)&line_tags}")
-            edittags = TEXT_CONTENT_TAG&line_tags
-
-            #logger.debug(f"line {i} content: {repr(line)} len: {len(line)}")
-            if "spacesimage" not in line_tags and "invalidfilltext" not in line_tags:
+            invalidfill = tagged('invalidfilltext', i, line)
+            if not invalidfill and not tagged('spacesimage', i, line):
                 lct = f"{line}\n"
-            elif len(line)>0 and ("spacesimage" in line_tags or "invalidfilltext" in line_tags):
+            elif len(line)>0:
                 lct = f"{line}"
-            #logger.debug(f"{repr(lct)}")
             if lct != None:
                 if i == start and i == end:
                     lct = lct[start_c:end_c]
@@ -324,26 +304,40 @@ class Editor:
                 elif i == end:
                     lct = lct[:end_c]
                 content.append(lct)
-            if 'invalidfilltext' in edittags and len(edittags) == 1: break
-        
-        """
-        line_tags = set(text_area.tag_names(f"{end}.0")+text_area.tag_names(f"{end}.end"))
+            # 只带 invalidfilltext 一个内容标签的行是末尾的无效填充，其后不再是文件内容
+            if invalidfill and not any(tagged(tag, i, line) for tag in TEXT_CONTENT_TAG - {'invalidfilltext'}):
+                break
 
-        line = text_area.get(f"{end}.0", f"{end}.end")
-        if len(line) > 0:
-            content.append(f"{line}")
-        """
-        #logger.debug(f"get_area, content:\n {content}")
         return content
 
     @staticmethod
-    def file_to_lines(file_path):
-        """读取文件并返回行列表"""
+    def get_content(text_area, final_newline=False) -> list[str]:
+        """
+        整个文件的内容：有文档模型时直接从模型取，否则从控件读取。
+        final_newline 为 False/True 分别与 get_area(text_area, '1.0', 'end-1c'/'end') 一致
+        """
+        document = DocumentModel.of(text_area)
+        if document is not None:
+            return document.content(final_newline)
+        return Editor.get_area(text_area, '1.0', 'end' if final_newline else 'end-1c')
+
+    @staticmethod
+    def line_count(widget) -> int:
+        """控件的行数（index('end') 的行号减 1），有文档模型时直接取模型的行数"""
+        document = DocumentModel.of(widget)
+        if document is None or document.frozen is not None:
+            return int(widget.index('end').split('.')[0]) - 1
+        if document.stale:
+            document.resync()
+        return len(document.lines)
+
+    @staticmethod
+    def file_to_lines(file_path) -> MappedLines:
+        """以内存映射打开文件并识别编码，返回惰性解码的行序列，用完需 close（或用 with）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-                logger.info(f"Successfully read {len(lines)} lines from {file_path}")
-                return lines
+            lines = MappedLines(file_path)
+            logger.info(f"Successfully read {len(lines)} lines from {file_path}, encoding: {lines.encoding}")
+            return lines
         except Exception as e:
             logger.error(f"Failed to read file {file_path}, error: {str(e)}")
             raise
@@ -396,41 +390,29 @@ class Editor:
 
     @staticmethod
     def update_line_numbers(text_area, left_line_numbers, right_line_numbers):
-        """根据文本内容更新行号"""
-        
-        line_numbers_list = [left_line_numbers, right_line_numbers]
-        
-        for line_numbers in line_numbers_list:
+        """
+        根据文本内容更新行号：行数与末尾无效填充行数取自文档模型，
+        行号在 Python 中拼成一个字符串，每个行号栏只插入一次
+        """
+        document = DocumentModel.of(text_area)
+        if document is None or document.frozen is not None:
+            # 没有文档模型（或模型被虚拟视图冻结）时从控件重建一次
+            document = DocumentModel(text_area)
+            document.resync()
+        invalidfiledlines = document.trailing_fill()
+        lines = len(document.lines)
+
+        # 末尾无效填充行不足 5 行时多显示几个行号，由 compareend 补齐文本区
+        extra = max(0, 5 - invalidfiledlines)
+        invalidfiledlines += extra
+        logger.debug(f"lines: {lines} invalidfiledlines: {invalidfiledlines}")
+        numbers = '\n'.join(map(str, range(1, lines + extra + 1)))
+        for line_numbers in (left_line_numbers, right_line_numbers):
             line_numbers.config(state='normal')
-            line_numbers.delete(1.0, END)
-
-        invalidfiledlines = 0
-        # 计算当前文本中的行数
-        lines = int(text_area.index('end').split('.')[0])-1
-        for i in range(1,lines):
-            line_numbers_list[0].insert(END, f"{i}\n")
-            line_numbers_list[1].insert(END, f"{i}\n")
-        line_numbers_list[0].insert(END, f"{lines}")
-        line_numbers_list[1].insert(END, f"{lines}")
-
-        #logger.debug(f"lines: {lines}")
-        for i in range(lines-1, 1, -1):
-            linetags = set(text_area.tag_names(f"{i}.end")+text_area.tag_names(f"{i}.0"))
-            #logger.debug(f"linetags: {linetags}")
-            if "invalidfilltext" in linetags:
-                invalidfiledlines += 1
-            else: break
-        
-        logger.debug(f"invalidfiledlines: {invalidfiledlines}")
-        for i in range(lines+1, lines+6):
-            if invalidfiledlines >= 5: break
-            line_numbers_list[0].insert(END, f"\n{i}")
-            line_numbers_list[1].insert(END, f"\n{i}")
-            invalidfiledlines += 1
-                
-        for line_numbers in line_numbers_list:
+            line_numbers.delete('1.0', END)
+            line_numbers.insert('1.0', numbers)
             line_numbers.config(state='disabled')
-            
+
         text_area.event_generate("<<compareend>>", data={'invalidfiledlines':invalidfiledlines})    
     
     #————————————————————————————————
@@ -441,11 +423,17 @@ class Editor:
         """将内容保存到指定路径"""
         #logger = StructuredLogger()
         try:
-            with open(path, 'w', encoding='utf-8') as file:
-                contents = Editor.get_area(text_area, '1.0', 'end')
-                content = ''.join(contents)
+            # 按打开时识别的编码写回，纯 ASCII 或无法编码新内容时使用 utf-8
+            encoding = text_area.__dict__.get('__encoding', 'ascii')
+            contents = Editor.get_content(text_area, final_newline=True)
+            content = ''.join(contents)
+            try:
+                content.encode(encoding)
+            except UnicodeEncodeError:
+                encoding = 'utf-8'
+            with open(path, 'w', encoding=encoding) as file:
                 file.write(content)
-            logger.info(f"File successfully saved to {path}")
+            logger.info(f"File successfully saved to {path}, encoding: {encoding}")
         except Exception as e:
             logger.error(f"Failed to save file to {path}, error: {str(e)}")
             raise
@@ -476,6 +464,7 @@ class Editor:
         lfl = argsdict.get('textflines', None)
         rfl = argsdict.get('tagflines', None)
         
+        Editor.cancel_load(text_area)
         Editor.text_area_reset(text_area)
         Editor.line_number_reset(text_line_numbers)
         Editor.line_number_reset(tag_line_numbers)
@@ -484,21 +473,122 @@ class Editor:
         
         logger.info(f"file_path: {file_path}")
         if file_path:
-            text_content = Editor.file_to_lines(file_path)
-            text_area.insert('1.0', "".join(text_content))
-        """
-        logger.info("开始对比文件")
-        modified = argsdict.get('modified')
-        
-        if modified == 'left':
-            match_pairs = compare_files(text_content, tag_content)
-            display_results(text_area, tag_area, text_content, tag_content, match_pairs, lfl, rfl)
+            Editor.start_load(file_path, text_area, text_line_numbers, tag_line_numbers, argsdict.get('statusbar'))
         else:
-            match_pairs = compare_files(tag_content, text_content)
-            display_results(tag_area, text_area, tag_content, text_content, match_pairs, rfl, lfl)
+            Editor.update_line_numbers(text_area, text_line_numbers, tag_line_numbers)
+
+    @staticmethod
+    def is_loading(text_area) -> bool:
+        return text_area.__dict__.get('__loadjob') is not None
+
+    @staticmethod
+    def start_load(file_path, text_area, left_line_numbers, right_line_numbers, statusvar=None):
         """
-        Editor.update_line_numbers(text_area, text_line_numbers, tag_line_numbers)
-        
+        后台线程读取、解码文件，分块经队列和虚拟事件交给主线程依次插入文本区；
+        加载期间文本区禁用。同一文本区再次加载时取消上一次
+        """
+        Editor.cancel_load(text_area)
+        job = {
+            'path': file_path,
+            'cancel': threading.Event(),
+            'queue': queue.Queue(),
+            'line_numbers': (left_line_numbers, right_line_numbers),
+            'statusvar': statusvar,
+            'prestate': text_area.cget('state'),
+            'cursor': text_area.cget('cursor'),
+            'started': time.perf_counter(),
+        }
+        text_area.__dict__['__loadjob'] = job
+        if not text_area.__dict__.get('__loadbound'):
+            text_area.bind(FILE_LOAD_EVENT, lambda e: Editor.on_load_message(text_area), add='+')
+            text_area.__dict__['__loadbound'] = True
+
+        text_area.config(state='disabled', cursor='watch')
+        if statusvar:
+            statusvar.set(f"正在加载 {file_path}...")
+        threading.Thread(target=Editor._load_worker, args=(text_area, job), daemon=True).start()
+
+    @staticmethod
+    def _load_worker(text_area, job):
+        """（子线程）打开文件并按 FILE_INSERT_CHUNK_LINES 行一块解码，取消后不再放入消息"""
+        def post(message):
+            job['queue'].put(message)
+            try:
+                text_area.event_generate(FILE_LOAD_EVENT, when='tail')
+            except (TclError, RuntimeError) as e:
+                # 控件已销毁或主循环已退出，消息无人处理
+                logger.debug(f"无法通知主线程: {e}")
+
+        try:
+            with Editor.file_to_lines(job['path']) as lines:
+                post(('open', lines.encoding, len(lines)))
+                for start in range(0, len(lines), FILE_INSERT_CHUNK_LINES):
+                    if job['cancel'].is_set():
+                        logger.debug(f"{job['path']} 加载已取消")
+                        return
+                    post(('chunk', lines.text(start, start + FILE_INSERT_CHUNK_LINES),
+                          min(start + FILE_INSERT_CHUNK_LINES, len(lines))))
+            post(('done',))
+        except Exception as e:
+            post(('error', str(e)))
+
+    @staticmethod
+    def on_load_message(text_area):
+        """
+        （主线程）处理当前加载任务的消息，每次最多占用 VIEW_RENDER_SLICE_MS 毫秒，
+        剩余的消息用 after 接着处理，插入大文件期间界面保持响应
+        """
+        job = text_area.__dict__.get('__loadjob')
+        if job is None:
+            return
+        deadline = time.perf_counter() + VIEW_RENDER_SLICE_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                kind, *data = job['queue'].get_nowait()
+            except queue.Empty:
+                return
+            if kind == 'open':
+                text_area.__dict__['__encoding'], job['total'] = data
+            elif kind == 'chunk':
+                text, loaded = data
+                text_area.config(state='normal')
+                text_area.insert('end', text)
+                text_area.config(state='disabled')
+                if job['statusvar']:
+                    job['statusvar'].set(f"正在加载 {job['path']} {loaded}/{job['total']} 行...")
+            else:
+                Editor._finish_load(text_area, job, data[0] if kind == 'error' else None)
+                return
+        text_area.after(1, Editor.on_load_message, text_area)
+
+    @staticmethod
+    def _finish_load(text_area, job, error=None):
+        text_area.__dict__['__loadjob'] = None
+        text_area.config(state=job['prestate'], cursor=job['cursor'])
+        # 加载的内容不进入撤销栈
+        text_area.edit_reset()
+        Editor.update_line_numbers(text_area, *job['line_numbers'])
+        if error is not None:
+            logger.error(f"加载文件 {job['path']} 失败: {error}")
+            if job['statusvar']:
+                job['statusvar'].set(f"加载文件失败: {error}")
+            return
+        elapsed = time.perf_counter() - job['started']
+        logger.info(f"{job['path']} 加载完成，{job['total']} 行，用时 {elapsed:.2f} 秒")
+        if job['statusvar']:
+            job['statusvar'].set(f"已加载 {job['path']}（{text_area.__dict__['__encoding']}，{job['total']} 行）")
+
+    @staticmethod
+    def cancel_load(text_area):
+        """取消文本区正在进行的加载，恢复文本区状态（已插入的部分由调用方清除）"""
+        job = text_area.__dict__.get('__loadjob')
+        if job is None:
+            return
+        text_area.__dict__['__loadjob'] = None
+        job['cancel'].set()
+        text_area.config(state=job['prestate'], cursor=job['cursor'])
+        logger.debug(f"取消加载 {job['path']}")
+
     @staticmethod
     def select_file(path_var, root):
         FileSelector.select_file(path_var, root)
@@ -0,0 +1,179 @@
+"""
+以内存映射方式打开文本文件：根据 BOM、纯 ASCII 快速判断或依次试解码（并检查是否合理）确定编码，
+只建立行起始偏移的索引，行内容在访问时才解码
+"""
+import re
+import mmap
+import codecs
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+from pycompare.config import (
+    FILE_ENCODINGS, FILE_DETECT_CHUNK_BYTES, FILE_GB18030_MIN_COMMON_RATIO, FILE_GB18030_MIN_CHARS
+)
+
+import logging
+from pycompare.logging_config import setup_logging
+logger = setup_logging(logging.DEBUG, log_tag=__name__)
+
+# UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_non_ascii = re.compile(rb'[\x80-\xff]')
+_non_ascii_text = re.compile(r'[^\x00-\x7f]')
+# 前后紧挨 ASCII 字母的单个非 ASCII 字符，多为 Latin-1 单词中相邻两个重音字母拼成的汉字
+_inside_latin_word = re.compile(r'(?<=[A-Za-z])[^\x00-\x7f](?=[A-Za-z])')
+_newline = re.compile(rb'\n')
+_lone_cr = re.compile(rb'\r(?!\n)')
+
+def _decodes(data, encoding) -> bool:
+    """按块增量解码整个 data，只校验不保留结果"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        for start in range(0, len(data), FILE_DETECT_CHUNK_BYTES):
+            decoder.decode(data[start:start + FILE_DETECT_CHUNK_BYTES])
+        decoder.decode(b'', final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def _gb2312(char) -> bool:
+    try:
+        char.encode('gb2312')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def _looks_chinese(data) -> bool:
+    """
+    能按 GB18030 解码的 data 是否像中文文本（只检查开头 FILE_DETECT_CHUNK_BYTES 字节）：
+    解码出的非 ASCII 字符大多应是常用字（属于 GB2312，两个字节都是高位字节），
+    且常用字至少 FILE_GB18030_MIN_CHARS 个。
+    Latin-1 的重音字母多为前后都是 ASCII 的单个高位字节，与后面的 ASCII 字节拼成 GBK 的生僻字；
+    单词中相邻的两个重音字母（如 Größe 的 öß）可能拼成常用字，但前后都是 ASCII 字母，
+    这样的字不计入常用字
+    """
+    text = codecs.getincrementaldecoder('gb18030')(errors='replace').decode(data[:FILE_DETECT_CHUNK_BYTES])
+    chars = Counter(_non_ascii_text.findall(text))
+    inside = Counter(_inside_latin_word.findall(text))
+    common = sum(count - inside[char] for char, count in chars.items() if _gb2312(char))
+    return common >= FILE_GB18030_MIN_CHARS and common >= chars.total() * FILE_GB18030_MIN_COMMON_RATIO
+
+def detect_encoding(data) -> str:
+    """
+    data 为 bytes 或 mmap：有 BOM 时取 BOM 对应的编码，纯 ASCII 为 ascii，
+    否则取 FILE_ENCODINGS 中第一个能解码的（gb18030 还需看起来像中文，见 _looks_chinese）
+    """
+    head = data[:4]
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if _non_ascii.search(data) is None:
+        return 'ascii'
+    for encoding in FILE_ENCODINGS:
+        if _decodes(data, encoding) and (encoding != 'gb18030' or _looks_chinese(data)):
+            return encoding
+    return 'latin-1'
+
+def split_lines(text) -> list[str]:
+    """与文本模式 readlines() 相同的分行：换行符统一为 \\n 并保留在行尾"""
+    parts = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    lines = [f"{part}\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+class MappedLines(Sequence):
+    """
+    文件的行序列，内容与 open(encoding=...).readlines() 相同。
+    ASCII、UTF-8、GB18030、Latin-1 中换行字节 0x0A 不会出现在多字节字符内部，
+    按字节建立行偏移后逐行惰性解码；UTF-16/32 或含单独 \\r 换行的文件整体解码。
+    用完调用 close（或用 with）释放映射，之后只能访问已解码过的行
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        self._lines = None
+        self._cache = {}
+        try:
+            size = self._file.seek(0, 2)
+            # 空文件无法映射
+            if size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._map if size else b''
+            self.encoding = detect_encoding(data)
+            self._start = len(codecs.BOM_UTF8) if self.encoding == 'utf-8-sig' else 0
+            if self.encoding.startswith(('utf-16', 'utf-32')) or (data.find(b'\r', self._start) >= 0 and _lone_cr.search(data, self._start)):
+                self._lines = split_lines(str(data[:], self.encoding))
+                self.close()
+            else:
+                self._offsets = self._index(data, self._start)
+        except Exception:
+            self.close()
+            raise
+        logger.debug(f"{path}: 编码 {self.encoding}，{len(self)} 行")
+
+    @staticmethod
+    def _index(data, start) -> array:
+        """每行的起始字节偏移，最后追加文件末尾"""
+        offsets = array('q', [start])
+        offsets.extend(map(re.Match.end, _newline.finditer(data, start)))
+        if offsets[-1] != len(data):
+            offsets.append(len(data))
+        return offsets
+
+    def __len__(self):
+        if self._lines is not None:
+            return len(self._lines)
+        return len(self._offsets) - 1
+
+    def _decode(self, start, stop) -> str:
+        codec = 'utf-8' if self.encoding == 'utf-8-sig' else self.encoding
+        if self._map is None:
+            raise ValueError(f"{self.path} 已关闭")
+        return str(self._map[self._offsets[start]:self._offsets[stop]], codec).replace('\r\n', '\n')
+
+    def __getitem__(self, index):
+        if self._lines is not None:
+            return self._lines[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        line = self._cache.get(index)
+        if line is None:
+            line = self._cache[index] = self._decode(index, index + 1)
+        return line
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def text(self, start=0, stop=None) -> str:
+        """[start, stop) 行拼接后的文本，整段一次解码"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if self._lines is not None:
+            return ''.join(self._lines[start:stop])
+        if start >= stop:
+            return ''
+        return self._decode(start, stop)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,17 +1,26 @@
-import re
+import time
+import queue
+import threading
+from bisect import bisect_left
 import tkinter as tk
 from tkinter import (
     Toplevel, Label, Entry, StringVar, IntVar, Checkbutton, Radiobutton, 
-    Button, Frame, messagebox, INSERT, LEFT, W, BOTH
+    Button, Frame, messagebox, INSERT, LEFT, W, BOTH, TclError
     )
+from pycompare.workspace.search_engine import SearchEngine, compile_query, match_batches
+from pycompare.workspace.diff_view import VIEW_MATERIALIZED_EVENT
+from pycompare.config import SEARCH_HIGHLIGHT_BATCH, VIEW_RENDER_SLICE_MS
 
 import logging
 from pycompare.logging_config import setup_logging
 logger = setup_logging(logging.DEBUG, log_tag=__name__)
 
+SEARCH_ALL_TAG = 'search_all'
+SEARCH_MATCHES_EVENT = '<<SearchMatches>>'
+
 class SearchDialog:
-    _DIALOG_WIDTH = 300
-    _DIALOG_HEIGHT = 180
+    _DIALOG_WIDTH = 380
+    _DIALOG_HEIGHT = 210
     def __init__(self, parent, workspace):
         self.parent = parent
         self.workspace = workspace
@@ -68,9 +77,13 @@ class SearchDialog:
         left_radio.grid(row=2, column=1, sticky=W)
         right_radio.grid(row=3, column=1, sticky=W)
         
+        # 匹配计数：第 N 个，共 M 个
+        self.count_var = StringVar()
+        Label(main_frame, textvariable=self.count_var).grid(row=4, column=0, columnspan=2, sticky=W, padx=5)
+        
         # 按钮
         button_frame = Frame(main_frame)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        button_frame.grid(row=5, column=0, columnspan=2, pady=10)
         
         self.find_next_btn = Button(button_frame, text="查找下一个", command=self.find_next)
         self.find_next_btn.pack(side=LEFT, padx=5)
@@ -78,17 +91,58 @@ class SearchDialog:
         self.find_prev_btn = Button(button_frame, text="查找上一个", command=self.find_previous)
         self.find_prev_btn.pack(side=LEFT, padx=5)
         
-        self.close_btn = Button(button_frame, text="关 闭", command=self.dialog.destroy)
+        self.highlight_btn = Button(button_frame, text="全部高亮", command=self.highlight_all)
+        self.highlight_btn.pack(side=LEFT, padx=5)
+        
+        self.close_btn = Button(button_frame, text="关 闭", command=self.close)
         self.close_btn.pack(side=LEFT, padx=5)
         
         # 绑定快捷键
         self.dialog.bind('<Return>', lambda event: self.find_next())
-        self.dialog.bind('<Escape>', lambda event: self.dialog.destroy())
+        self.dialog.bind('<Escape>', lambda event: self.close())
+        self.dialog.protocol("WM_DELETE_WINDOW", self.close)
+        # 后台统计线程放入匹配后产生该虚拟事件
+        self.dialog.bind(SEARCH_MATCHES_EVENT, self._on_matches)
+        # 虚拟滚动视图重新放入窗口后，控件中的标签随旧内容一起清除，需重新添加
+        self.view_bindings = [
+            (text_area, text_area.bind(VIEW_MATERIALIZED_EVENT, self._on_materialized, add='+'))
+            for text_area in self._text_areas().values()
+        ]
         
         # 保存当前搜索状态
         self.last_search = ""
         self.last_position = {"left": "1.0", "right": "1.0"}
         self.current_window = "left"
+        # 当前定位到的匹配 (窗口, 文本偏移)，及其 (窗口, '行.列', '行.列')
+        self.current_match = None
+        self.current_span = None
+        # 正在进行或已完成的全部高亮任务
+        self.highlight_job = None
+    
+    def _text_areas(self):
+        return {"left": self.workspace.l_text_area, "right": self.workspace.r_text_area}
+    
+    def close(self):
+        """停止统计，清除全部高亮并关闭对话框"""
+        self._cancel_highlight()
+        for text_area, funcid in self.view_bindings:
+            text_area.unbind(VIEW_MATERIALIZED_EVENT, funcid)
+        for text_area in self._text_areas().values():
+            text_area.tag_remove(SEARCH_ALL_TAG, "1.0", "end")
+        self.dialog.destroy()
+    
+    def _widget_span(self, start, end):
+        """
+        查找引擎中的 '行.列' 对应的控件索引。虚拟滚动时引擎查找的是全部显示行，
+        只有起点在当前窗口内的匹配可以标记（终点超出窗口时标记到窗口末尾），否则返回 None
+        """
+        view = self.workspace.diff_view
+        if view is None:
+            return start, end
+        start = view.to_widget(start)
+        if start is None:
+            return None
+        return start, view.to_widget(end) or "end"
     
     def find_next(self):
         self._find(direction=1)
@@ -111,114 +165,220 @@ class SearchDialog:
             text_area = self.workspace.r_text_area
             self.current_window = "right"
         
-        # 获取文本内容
-        text = text_area.get("1.0", "end-1c")
-        
-        # 获取当前窗口的搜索状态
-        current_last_position = self.last_position[self.current_window]
+        engine = SearchEngine.of(text_area)
         
         # 如果搜索文本改变，重置位置
         if search_text != self.last_search:
             self.last_search = search_text
-            for window in ["left", "right"]:
+            for window, area in self._text_areas().items():
                 if direction == 1:
                     self.last_position[window] = "1.0"
                 else:
-                    # 对于反向搜索，使用文本的末尾位置
-                    if window == "left":
-                        self.last_position[window] = self.workspace.l_text_area.index("end-1c")
-                    else:
-                        self.last_position[window] = self.workspace.r_text_area.index("end-1c")
-        
-        # 设置搜索标志
-        flags = 0 if self.case_var.get() else re.IGNORECASE
-        
-        # 执行搜索
-        try:
-            # 对于不区分大小写的搜索，我们需要使用re.escape和IGNORECASE
-            if self.case_var.get():
-                # 区分大小写，直接搜索
-                matches = list(re.finditer(search_text, text))
-            else:
-                # 不区分大小写，转义特殊字符并使用IGNORECASE
-                matches = list(re.finditer(re.escape(search_text), text, re.IGNORECASE))
-        except re.error:
-            # 如果正则表达式有错误，使用简单的字符串搜索
-            matches = []
-            search_lower = search_text.lower() if not self.case_var.get() else search_text
-            text_to_search = text.lower() if not self.case_var.get() else text
-            pos = 0
-            while True:
-                pos = text_to_search.find(search_lower, pos)
-                if pos == -1:
-                    break
-                matches.append(type('obj', (object,), {'start': lambda: pos, 'end': lambda: pos + len(search_text)}))
-                pos += 1
-        
-        if not matches:
+                    # 对于反向搜索，使用文本的末尾位置（虚拟滚动时为全部显示行的末尾）
+                    area_engine = SearchEngine.of(area)
+                    area_engine.refresh()
+                    self.last_position[window] = area_engine.index(len(area_engine.text))
+        
+        # 从上次匹配的位置开始查找，到达末尾/开头时从另一端继续
+        match = engine.find(search_text, self.case_var.get(), self.last_position[self.current_window], direction)
+        if match is None:
             messagebox.showinfo("提示", f"在{'左侧' if target_window == 'left' else '右侧'}窗口找不到 '{search_text}'")
             return
         
-        # 找到当前位置之后的匹配项
-        last_line, last_col = map(int, current_last_position.split('.'))
-        found = False
-        
-        if direction == 1:
-            # 查找下一个
-            for match in matches:
-                start_line, start_col = self._index_to_line_col(text, match.start())
-                # 确保正确比较位置
-                if (start_line > last_line) or (start_line == last_line and start_col > last_col):
-                    self._highlight_match(text_area, match.start(), match.end())
-                    self.last_position[self.current_window] = f"{start_line}.{start_col}"
-                    found = True
-                    break
-            # 如果没找到，从开头重新查找
-            if not found and matches:
-                match = matches[0]
-                self._highlight_match(text_area, match.start(), match.end())
-                start_line, start_col = self._index_to_line_col(text, match.start())
-                self.last_position[self.current_window] = f"{start_line}.{start_col}"
+        self.current_span = (self.current_window, *match)
+        self._highlight_match(text_area, *match)
+        self.last_position[self.current_window] = match[0]
+        self.current_match = (self.current_window, engine.offset(match[0]))
+        if self.highlight_job:
+            self._show_count()
+    
+    def highlight_all(self):
+        """
+        高亮两侧窗口中的全部匹配并计数：在主线程取两侧文本的快照，子线程逐批查找，
+        每批匹配经队列交给主线程一次 tag_add，统计过程中计数随之更新
+        """
+        search_text = self.search_var.get()
+        if not search_text:
+            messagebox.showinfo("提示", "请输入要查找的内容")
+            return
+        self._cancel_highlight()
+        
+        job = {
+            'key': (search_text, bool(self.case_var.get())),
+            'cancel': threading.Event(),
+            'queue': queue.Queue(),
+            'texts': {},
+            'revisions': {},
+            'offsets': {"left": [], "right": []},
+            'indices': {"left": [], "right": []},
+            'done': set(),
+            'started': time.perf_counter(),
+        }
+        for window, text_area in self._text_areas().items():
+            text_area.tag_remove(SEARCH_ALL_TAG, "1.0", "end")
+            text_area.tag_config(SEARCH_ALL_TAG, background="#ffe58f")
+            text_area.tag_config("search_highlight", background="yellow", foreground="black")
+            text_area.tag_raise("search_highlight")
+            engine = SearchEngine.of(text_area)
+            engine.refresh()
+            job['texts'][window] = engine.text
+            job['revisions'][window] = engine.revision
+        self.highlight_job = job
+        self._show_count()
+        
+        pattern = compile_query(search_text, self.case_var.get())
+        threading.Thread(target=self._scan_worker, args=(job, pattern), daemon=True).start()
+    
+    def _cancel_highlight(self):
+        job, self.highlight_job = self.highlight_job, None
+        if job:
+            job['cancel'].set()
+    
+    def _scan_worker(self, job, pattern):
+        """（子线程）依次统计左右窗口文本快照中的匹配，取消后不再放入消息"""
+        def post(message):
+            job['queue'].put(message)
+            try:
+                self.dialog.event_generate(SEARCH_MATCHES_EVENT, when='tail')
+            except (TclError, RuntimeError) as e:
+                # 对话框已关闭或主循环已退出
+                logger.debug(f"无法通知主线程: {e}")
+        
+        for window in ("left", "right"):
+            for offsets, indices in match_batches(job['texts'][window], pattern,
+                                                  SEARCH_HIGHLIGHT_BATCH, job['cancel']):
+                post(('batch', window, offsets, indices))
+            if job['cancel'].is_set():
+                return
+            post(('done', window))
+    
+    def _on_matches(self, event=None):
+        """
+        （主线程）把当前任务的匹配加上高亮标签，每次最多占用 VIEW_RENDER_SLICE_MS 毫秒，
+        剩余的批次用 after 接着处理
+        """
+        job = self.highlight_job
+        if job is None:
+            return
+        text_areas = self._text_areas()
+        deadline = time.perf_counter() + VIEW_RENDER_SLICE_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                kind, window, *data = job['queue'].get_nowait()
+            except queue.Empty:
+                return
+            if kind == 'batch':
+                offsets, indices = data
+                # 批次中的位置按开始时的文本快照计算，文本已修改时不能再标记到控件上
+                if not self._snapshot_current(job, window):
+                    self._abort_highlight()
+                    return
+                self._tag_matches(text_areas[window], indices)
+                job['offsets'][window] += offsets
+                job['indices'][window] += indices
+            else:
+                job['done'].add(window)
+                if len(job['done']) == 2:
+                    elapsed = time.perf_counter() - job['started']
+                    logger.debug(f"全部高亮完成，{self._total(job)} 个匹配，用时 {elapsed:.2f} 秒")
+            self._show_count()
+        self.dialog.after(1, self._on_matches)
+    
+    def _snapshot_current(self, job, window) -> bool:
+        """窗口的文本是否仍是任务开始时的快照（有文档模型时 revision 不变即可，不重新取文本）"""
+        engine = SearchEngine.of(self._text_areas()[window])
+        engine.refresh()
+        return engine.revision == job['revisions'][window] and engine.text is job['texts'][window]
+    
+    def _abort_highlight(self):
+        """统计期间文本被修改：停止统计并清除已添加的高亮，计数不再可靠"""
+        self._cancel_highlight()
+        for text_area in self._text_areas().values():
+            text_area.tag_remove(SEARCH_ALL_TAG, "1.0", "end")
+        self.count_var.set("统计期间文本已修改，请重新全部高亮")
+        logger.debug("统计期间文本已修改，已取消全部高亮")
+    
+    def _tag_matches(self, text_area, indices):
+        """indices 为 [起, 止, 起, 止, ...]，普通显示时一次 tag_add，虚拟滚动时只标记窗口内的匹配"""
+        if self.workspace.diff_view is not None:
+            spans = (self._widget_span(*indices[k:k + 2]) for k in range(0, len(indices), 2))
+            indices = [index for span in spans if span for index in span]
+        if indices:
+            text_area.tag_add(SEARCH_ALL_TAG, *indices)
+    
+    def _on_materialized(self, event):
+        """虚拟滚动视图重新放入窗口后，重新标记窗口内的当前匹配与全部高亮的匹配"""
+        view = self.workspace.diff_view
+        if view is None:
+            return
+        for window, text_area in self._text_areas().items():
+            if text_area is event.widget:
+                break
         else:
-            # 查找上一个
-            for match in reversed(matches):
-                start_line, start_col = self._index_to_line_col(text, match.start())
-                # 确保正确比较位置
-                if (start_line < last_line) or (start_line == last_line and start_col < last_col):
-                    self._highlight_match(text_area, match.start(), match.end())
-                    self.last_position[self.current_window] = f"{start_line}.{start_col}"
-                    found = True
-                    break
-            # 如果没找到，从末尾开始查找
-            if not found and matches:
-                match = matches[-1]
-                self._highlight_match(text_area, match.start(), match.end())
-                start_line, start_col = self._index_to_line_col(text, match.start())
-                self.last_position[self.current_window] = f"{start_line}.{start_col}"
-    
-    def _index_to_line_col(self, text, index):
-        """将字符索引转换为行号和列号"""
-        lines = text[:index].split('\n')
-        line_num = len(lines)
-        col_num = len(lines[-1]) if lines else 0
-        return line_num, col_num
+            return
+        if self.current_span and self.current_span[0] == window:
+            span = self._widget_span(*self.current_span[1:])
+            if span:
+                text_area.tag_add("search_highlight", *span)
+        job = self.highlight_job
+        if job is None or not self._snapshot_current(job, window):
+            return
+        engine = SearchEngine.of(text_area)
+        # 窗口内的匹配：起始偏移在窗口首行行首与窗口末行之后的行首之间
+        starts = engine.line_starts
+        lo = starts[min(view.start, len(starts) - 1)]
+        hi = starts[view.end] if view.end < len(starts) else len(engine.text) + 1
+        offsets = job['offsets'][window]
+        first, last = bisect_left(offsets, lo), bisect_left(offsets, hi)
+        self._tag_matches(text_area, job['indices'][window][2 * first:2 * last])
+    
+    @staticmethod
+    def _total(job) -> int:
+        return len(job['offsets']["left"]) + len(job['offsets']["right"])
+    
+    def _current_ordinal(self):
+        """当前匹配在两侧全部匹配中的序号（左侧在前），无法确定时返回 None"""
+        job = self.highlight_job
+        if not self.current_match or job['key'] != (self.search_var.get(), bool(self.case_var.get())):
+            return None
+        window, offset = self.current_match
+        # 统计后文本已修改时序号不再可靠
+        if not self._snapshot_current(job, window):
+            return None
+        if window == "right" and "left" not in job['done']:
+            return None
+        offsets = job['offsets'][window]
+        k = bisect_left(offsets, offset)
+        if k == len(offsets) or offsets[k] != offset:
+            return None
+        return k + 1 + (len(job['offsets']["left"]) if window == "right" else 0)
+    
+    def _show_count(self):
+        job = self.highlight_job
+        total = self._total(job)
+        text = f"共 {total} 个匹配" if len(job['done']) == 2 else f"已找到 {total} 个匹配，统计中..."
+        ordinal = self._current_ordinal()
+        if ordinal:
+            text = f"第 {ordinal} 个，{text}"
+        self.count_var.set(text)
     
     def _highlight_match(self, text_area, start, end):
-        """高亮显示匹配项并滚动到视图中"""
+        """高亮显示匹配项并滚动到视图中，start、end 为 '行.列'"""
         # 移除两个文本区域的所有高亮
         self.workspace.l_text_area.tag_remove("search_highlight", "1.0", "end")
         self.workspace.r_text_area.tag_remove("search_highlight", "1.0", "end")
         
-        # 计算开始和结束位置
-        text = text_area.get("1.0", "end-1c")
-        start_line, start_col = self._index_to_line_col(text, start)
-        end_line, end_col = self._index_to_line_col(text, end)
+        # 虚拟滚动时先把匹配所在的显示行放入窗口（放入后由 _on_materialized 添加高亮）
+        view = self.workspace.diff_view
+        if view is not None:
+            view.reveal(int(start.split('.')[0]))
+        start, end = self._widget_span(start, end)
         
         # 添加高亮
-        text_area.tag_add("search_highlight", f"{start_line}.{start_col}", f"{end_line}.{end_col}")
+        text_area.tag_add("search_highlight", start, end)
         text_area.tag_config("search_highlight", background="yellow", foreground="black")
         
         # 滚动到视图中并设置光标位置
-        text_area.see(f"{start_line}.{start_col}")
-        text_area.mark_set(INSERT, f"{end_line}.{end_col}")
-        text_area.focus_set()
\ No newline at end of file
+        text_area.see(start)
+        text_area.mark_set(INSERT, end)
+        text_area.focus_set()
@@ -0,0 +1,229 @@
+"""
+文本区的查找引擎：缓存文本与行起始偏移（bisect 换算 偏移 <-> 行.列），
+从当前位置按需向前或向后扫描，已扫描区间内的匹配位置按查询缓存，文本变化时才失效
+"""
+import re
+from bisect import bisect_left, bisect_right
+from pycompare.workspace.document import DocumentModel
+from pycompare.config import SEARCH_BACKWARD_CHUNK, SEARCH_CACHED_QUERIES
+
+import logging
+from pycompare.logging_config import setup_logging
+logger = setup_logging(logging.DEBUG, log_tag=__name__)
+
+def compile_query(search_text, case_sensitive) -> re.Pattern:
+    """区分大小写时按正则表达式查找（表达式有误时按普通文本），不区分大小写时按普通文本查找"""
+    if case_sensitive:
+        try:
+            return re.compile(search_text)
+        except re.error:
+            return re.compile(re.escape(search_text))
+    return re.compile(re.escape(search_text), re.IGNORECASE)
+
+def line_starts(text) -> list[int]:
+    """每行起始位置的文本偏移"""
+    starts = [0]
+    starts.extend(m.end() for m in re.finditer('\n', text))
+    return starts
+
+def offset_index(starts, offset) -> str:
+    line = bisect_right(starts, offset)
+    return f"{line}.{offset - starts[line - 1]}"
+
+def match_batches(text, pattern, batch_size, cancel=None):
+    """
+    （可在子线程调用）依次找出 text 中所有能匹配的位置（与 SearchEngine.find 一致，允许重叠），
+    每 batch_size 个产生一批 (起始偏移列表, tag_add 的索引参数 [起, 止, 起, 止, ...])，
+    两个列表按匹配一一对应（空匹配的起止相同，tag_add 时不产生效果）；cancel 置位后停止
+    """
+    starts = line_starts(text)
+    offsets, indices = [], []
+    p = 0
+    while p <= len(text):
+        m = pattern.search(text, p)
+        if m is None:
+            break
+        offsets.append(m.start())
+        indices += [offset_index(starts, m.start()), offset_index(starts, m.end())]
+        if len(offsets) >= batch_size:
+            if cancel is not None and cancel.is_set():
+                return
+            yield offsets, indices
+            offsets, indices = [], []
+        p = m.start() + 1
+    if offsets:
+        yield offsets, indices
+
+class _QueryCache:
+    """
+    一个查询在当前文本中的匹配：spans 为 [lo, hi) 区间的列表（有序、不相交），
+    区间内所有能匹配的起始位置都已记录在 starts 中，ends[start] 为该位置匹配的结束偏移
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.spans = []
+        self.starts = []
+        self.ends = {}
+
+    def _covering(self, pos):
+        """包含 pos 的已扫描区间的下标，没有时返回 None"""
+        k = bisect_right(self.spans, (pos, float('inf'))) - 1
+        if k >= 0 and self.spans[k][0] <= pos < self.spans[k][1]:
+            return k
+        return None
+
+    def _record(self, lo, hi, matches):
+        """[lo, hi) 已扫描，matches 为其中按位置排序的全部匹配；调用方保证新位置之间没有已记录的位置"""
+        new = [m for m in matches if m.start() not in self.ends]
+        if new:
+            k = bisect_left(self.starts, new[0].start())
+            self.starts[k:k] = [m.start() for m in new]
+            for m in new:
+                self.ends[m.start()] = m.end()
+        # 与相邻或重叠的区间合并
+        k = bisect_left(self.spans, (lo,))
+        if k > 0 and self.spans[k - 1][1] >= lo:
+            k -= 1
+            lo = self.spans[k][0]
+        j = k
+        while j < len(self.spans) and self.spans[j][0] <= hi:
+            hi = max(hi, self.spans[j][1])
+            j += 1
+        self.spans[k:j] = [(lo, hi)]
+
+    def next_from(self, text, pos):
+        """起始位置 >= pos 的第一个匹配 (start, end)，没有时返回 None"""
+        while pos <= len(text):
+            k = self._covering(pos)
+            if k is None:
+                break
+            n = bisect_left(self.starts, pos)
+            if n < len(self.starts) and self.starts[n] < self.spans[k][1]:
+                start = self.starts[n]
+                return start, self.ends[start]
+            pos = self.spans[k][1]
+        if pos > len(text):
+            return None
+        m = self.pattern.search(text, pos)
+        if m is None:
+            self._record(pos, len(text) + 1, ())
+            return None
+        self._record(pos, m.start() + 1, (m,))
+        return m.start(), m.end()
+
+    def previous_from(self, text, pos):
+        """起始位置 < pos 的最后一个匹配 (start, end)，没有时返回 None；未扫描的部分按块向前扫描"""
+        chunk = SEARCH_BACKWARD_CHUNK
+        while pos > 0:
+            k = self._covering(pos - 1)
+            if k is not None:
+                n = bisect_left(self.starts, pos) - 1
+                if n >= 0 and self.starts[n] >= self.spans[k][0]:
+                    start = self.starts[n]
+                    return start, self.ends[start]
+                pos = self.spans[k][0]
+                continue
+            # [lo, pos) 中逐个记录所有能匹配的位置，lo 不越过前一个已扫描区间
+            lo = max(0, pos - chunk)
+            k = bisect_left(self.spans, (pos,)) - 1
+            if k >= 0:
+                lo = max(lo, self.spans[k][1])
+            matches = []
+            p = lo
+            while p <= len(text):
+                m = self.pattern.search(text, p)
+                if m is None or m.start() >= pos:
+                    break
+                matches.append(m)
+                p = m.start() + 1
+            self._record(lo, pos, matches)
+            chunk *= 2
+        return None
+
+class SearchEngine:
+    """
+    一个文本区的查找引擎，保存在 text_area.__dict__['__search']。
+    有文档模型时文本取自模型，模型的 revision 不变则继续使用缓存；模型被虚拟视图冻结时
+    查找全部显示行的文本（'行.列' 为模型中的显示行，由调用方换算为控件索引）；
+    没有模型时每次从控件取文本，内容不同才失效
+    """
+    def __init__(self, text_area):
+        self.text_area = text_area
+        self.revision = None
+        self.text = None
+        self._line_starts = None
+        self._queries = {}
+
+    @staticmethod
+    def of(text_area) -> 'SearchEngine':
+        engine = text_area.__dict__.get('__search')
+        if engine is None:
+            engine = text_area.__dict__['__search'] = SearchEngine(text_area)
+        return engine
+
+    def refresh(self):
+        """文本区内容变化时丢弃文本、行索引与查询缓存"""
+        document = DocumentModel.of(self.text_area)
+        if document is not None and (document.frozen is None or document.display is not None):
+            if self.revision == document.revision and self.text is not None:
+                return
+            text = document.text() if document.frozen is None else document.display()
+            self.revision = document.revision
+        else:
+            text = self.text_area.get('1.0', 'end-1c')
+            self.revision = None
+            if text == self.text:
+                return
+        self.text = text
+        self._line_starts = None
+        self._queries.clear()
+        logger.debug(f"查找缓存失效，文本长度 {len(text)}")
+
+    @property
+    def line_starts(self) -> list[int]:
+        if self._line_starts is None:
+            self._line_starts = line_starts(self.text)
+        return self._line_starts
+
+    def offset(self, index) -> int:
+        """'行.列' -> 文本偏移"""
+        line, col = map(int, str(index).split('.'))
+        line = max(line, 1)
+        starts = self.line_starts
+        if line > len(starts):
+            return len(self.text)
+        line_end = starts[line] - 1 if line < len(starts) else len(self.text)
+        return min(starts[line - 1] + col, line_end)
+
+    def index(self, offset) -> str:
+        """文本偏移 -> '行.列'"""
+        return offset_index(self.line_starts, offset)
+
+    def _query(self, search_text, case_sensitive) -> _QueryCache:
+        key = (search_text, bool(case_sensitive))
+        cache = self._queries.get(key)
+        if cache is None:
+            if len(self._queries) >= SEARCH_CACHED_QUERIES:
+                self._queries.pop(next(iter(self._queries)))
+            cache = self._queries[key] = _QueryCache(compile_query(search_text, case_sensitive))
+        return cache
+
+    def find(self, search_text, case_sensitive, index, direction=1, wrap=True):
+        """
+        从 index 查找下一个（direction=1，起始位置在 index 之后）或上一个（起始位置在 index 之前）匹配，
+        到达末尾/开头时 wrap 为 True 则从另一端继续。返回 ('行.列', '行.列') 或 None
+        """
+        self.refresh()
+        cache = self._query(search_text, case_sensitive)
+        pos = self.offset(index)
+        if direction == 1:
+            span = cache.next_from(self.text, pos + 1)
+            if span is None and wrap:
+                span = cache.next_from(self.text, 0)
+        else:
+            span = cache.previous_from(self.text, pos)
+            if span is None and wrap:
+                span = cache.previous_from(self.text, len(self.text) + 1)
+        if span is None:
+            return None
+        return self.index(span[0]), self.index(span[1])
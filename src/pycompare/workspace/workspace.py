@@ -1,5 +1,7 @@
+import time
 import queue
 import threading
+from bisect import bisect_left
 import tkinter.messagebox as messagebox
 from tkinter import *
 from tkinter import ttk
@@ -7,26 +9,48 @@ from tkinterdnd2 import DND_FILES
 from pycompare.workspace.file_drop import FileDrop
 
 from pycompare.workspace.editor import Editor
+from pycompare.workspace.diff_view import VirtualDiffView, tag_merge_blocks
+from pycompare.workspace.document import DocumentModel
+from pycompare.workspace.diff_model import build_rows, row_runs, merge_blocks, gutter_runs
 #from pycompare.compare_core.compare_core import (
 # from pycompare.compare_core.core_no_numpy import (
 from pycompare.compare_core.core_qwen import (
-    compare_files, MatcherConfig, mySequenceMatcher
+    compare_files, incremental_compare, line_hashes
 )
+from pycompare.compare_core.cancel import CompareCancelled
+from pycompare.compare_core.worker_pool import shutdown_compare_pool
 from pycompare.workspace.events_queue import (
     clear_event_queue
 )
-from pycompare.config import MERGE_TAG_LOG, JUNK_STR_PATTERN
+from pycompare.config import (
+    VIEW_VIRTUAL_MIN_ROWS, VIEW_INSERT_BATCH_ROWS, VIEW_RENDER_SLICE_MS
+)
 
 import logging
 from pycompare.logging_config import setup_logging
 logger = setup_logging(logging.DEBUG, log_tag=__name__)
 
+COMPARE_MESSAGE_EVENT = '<<CompareMessage>>'
+
 class Workspace:
     def __init__(self, root, statusvar):
         self.is_refreshing = False
         self.root = root
         self.refresh_queue = queue.Queue()
+        # 每次启动对比递增，队列中代号不等于当前值的结果已过期，直接丢弃
+        self.compare_generation = 0
+        # 正在进行的对比的取消标记与对应的两个文本区
+        self.compare_cancel = None
+        self.refresh_areas = ()
+        # 最近一次相似度矩阵的进度指标（见 core_qwen.matrix_metrics），用于性能分析
+        self.compare_metrics = None
         self.statusvar = statusvar
+        # 上次对比的快照（两侧行内容、行哈希、match_pairs、显示行数），用于 F5 增量对比
+        self.compare_snapshot = None
+        # 结果行数较多时使用的虚拟滚动视图，为 None 时控件中是完整的对比结果
+        self.diff_view = None
+        # 正在分片显示的对比结果，为 None 时没有进行中的显示
+        self.render_job = None
 
         # 创建所有 UI 控件（保持不变）
         self._create_ui_skeleton()
@@ -40,6 +64,18 @@ class Workspace:
         self.root.after(50,  self._delay_configure_tags)    # 稍后配置样式
         self.root.after(100, self._delay_final_setup)       # 最终设置
 
+        # 主窗口销毁时关闭常驻对比进程池
+        self.root.bind('<Destroy>', self._on_root_destroy, add='+')
+        # 后台对比线程放入消息（进度、结果）后产生该虚拟事件唤醒主循环
+        self.root.bind(COMPARE_MESSAGE_EVENT, self.on_compare_message, add='+')
+
+    def _on_root_destroy(self, event):
+        if event.widget is self.root:
+            self.cancel_render(restore=False)
+            if self.compare_cancel:
+                self.compare_cancel.set()
+            shutdown_compare_pool()
+
     def _create_ui_skeleton(self):
         """仅创建控件和布局，不绑定复杂逻辑"""
         self.workspace = Frame(self.root)
@@ -103,6 +139,13 @@ class Workspace:
         self.r_text_area = Text(self.text_frame, wrap=NONE, undo=True, border=1)
         self.r_text_area.grid(row=0, column=6, sticky=NSEW)
 
+        # 文档模型跟踪两个文本区的内容，对比、保存时直接从模型读取
+        DocumentModel.attach(self.l_text_area)
+        DocumentModel.attach(self.r_text_area)
+        # 行号栏、文件行号栏也跟踪行数，compareend 补齐末尾时不再查询控件
+        for widget in (self.l_line_numbers, self.r_line_numbers, self.lfl, self.rfl):
+            DocumentModel.attach(widget)
+
         # 滚动条（先注册，不立即绑定复杂命令）
         self.scroll_ya = ttk.Scrollbar(self.text_frame, orient=VERTICAL)
         self.scroll_ya.grid(row=0, column=3, sticky=NS)
@@ -171,6 +214,9 @@ class Workspace:
             self.l_path_var, self.l_text_area, self.l_pathbox, self._make_l_args()))
         self.r_path_var.trace_add('write', lambda *args: Editor.load_file(
             self.r_path_var, self.r_text_area, self.r_pathbox, self._make_r_args()))
+        # 重新加载文件后，上次的对比快照失效
+        self.l_path_var.trace_add('write', lambda *args: self.drop_compare_snapshot())
+        self.r_path_var.trace_add('write', lambda *args: self.drop_compare_snapshot())
 
         # 拖放支持
         self.l_text_area.drop_target_register(DND_FILES)
@@ -235,8 +281,21 @@ class Workspace:
             'modified': 'right'
         }
 
+    def drop_compare_snapshot(self):
+        self.compare_snapshot = None
+        self.cancel_compare()
+        self.cancel_render()
+        # 虚拟视图的控件中只有部分行，先放回完整内容再由 load_file 重新加载
+        # （该 trace 后注册，先于 load_file 执行）
+        if self.diff_view:
+            view, self.diff_view = self.diff_view, None
+            view.release()
+
     def sync_scroll(self, text_a, text_b, line_num_a, line_num_b, fl_a, fl_b, *args):
             """同步滚动两个Text组件"""
+            if self.diff_view:
+                self.diff_view.scroll(*args)
+                return
             text_a.yview(*args)
             text_b.yview(*args)
             line_num_a.yview(*args)
@@ -247,6 +306,11 @@ class Workspace:
     def on_text_scroll(self, scroll_ya, scroll_yb, text_a, text_b, line_num_a, line_num_b, fla, flb, *args):
         """当Text组件滚动时调用此方法来更新滚动条的位置"""
         #logger.debug(f"on_text_scroll args: {args}")
+        if self.diff_view:
+            first, last = self.diff_view.on_widget_scroll(*args)
+            scroll_ya.set(first, last)
+            scroll_yb.set(first, last)
+            return
         scroll_ya.set(*args)
         scroll_yb.set(*args)
         self.sync_scroll(text_a, text_b, line_num_a, line_num_b, fla, flb, 'moveto', args[0])
@@ -263,222 +327,25 @@ class Workspace:
         self.sync_scroll_x(text_a, text_b, 'moveto', args[0])
 
     @staticmethod
-    def create_fileline_handler(lfl=None, rfl=None, start: int = 1):
-        fl = lfl if lfl else rfl
-        arrow = '\u27A1' if lfl else '\u2B05'
-        direction = "左" if lfl else "右"
-        merge_tag_count = len(set(fl.tag_names()))
-        
-        act_num = 0
-        has_arrow = False
-        has_closed = False
-        pre_tag = None
-        pre_line = None
-        block_start = None
-        block_end = None
-        
-        def judge_tag(flvalue):
-            tag = set()
-            ltag = flvalue[0:2].strip()
-            if '|' not in ltag and '|_' not in ltag and arrow not in ltag:
-                tag.update('equalline')
-            elif '|_' in ltag:
-                tag.update("closedline")
-            elif arrow in ltag:
-                tag.update("arrowline")
-            num = re.sub(r'[^\d]', '', flvalue)
-            if len(num) == 0:
-                tag.update('spacesimage')
-            return tag
-            
-        def get_merge_tag(line):
-            pattern = re.compile("^merge\d+$")
-            linetags = set(fl.tag_names(f'{line}.0') + fl.tag_names(f'{line}.end'))
-            linetag = [s for s in linetags if pattern.fullmatch(s)]
-            logger.debug(f"{line}行linetags: {linetags} linetag: {linetag}")
-            if len(linetag) > 0:
-                merge_tag = linetag[0]
-                start, end = fl.tag_ranges(merge_tag)
-                return merge_tag, start, end
-            return None, None, None
-        
-        def init(start):
-            nonlocal pre_line, has_arrow, act_num, block_start, pre_tag
-            start -= 1
-            fl.config(state="normal")
-            found_block_start = False
-            for i in range(start, 0, -1):
-                flvalue = fl.get(f"{i}.0", f"{i}.end")
-                if act_num == 0:
-                    num = re.sub(r'[^\d]', '', flvalue)
-                    num = int(num) if len(num)>0 else 0
-                    if num > 0:
-                        act_num = num
-                
-                if not found_block_start:
-                    tags = judge_tag(flvalue)
-                    if 'equalline' in tags:
-                        found_block_start = True
-                    elif 'closedline' in tags:
-                        merge_tag, block_start, tmp = get_merge_tag(i)
-                        logger.debug(f"{i}行merge_tag: {merge_tag} block_start: {block_start}")
-                        fl.tag_delete(merge_tag)
-                        fl.delete(f"{i}.0", f"{i}.end")
-                        pre_tag = 'openline'
-                        pre_line = i
-                        has_arrow = True
-                        found_block_start = True
-                        if act_num > 0 and i == start: act_num -= 1
-                    elif 'arrowline' in tags:
-                        has_arrow = True
-                        block_start = f"{i}.0"
-                        found_block_start = True
-                        
-                if act_num > 0 and found_block_start:
-                    break
-            fl.config(state="disabled")
-        init(start)
-
-        logger.debug(f"start: {start} act_num: {act_num} merge_tag_count: {merge_tag_count}")
-        logger.debug(f"has_arrow: {has_arrow} pre_tag: {pre_tag} pre_line: {pre_line} block_start: {block_start}")
-
-        def handle_non_modify(start_line, hand_op_func, *args):
-            nonlocal block_end, has_closed
-            max_line = args[0]
-            begin = start_line
-            need_change_num = True
-            need_change_tag = True
-            found_arrow_count = 0
-            lnum = act_num
-            end_line = 0
-            
-            for i in range(begin, max_line+1):
-                flvalue = fl.get(f"{i}.0", f"{i}.end")
-                if need_change_num:
-                    num = re.sub(r'[^\d]', '', flvalue)
-                    if len(num) > 0:
-                        num = int(num)
-                        if (lnum+1) == num:
-                            need_change_num = False
-                        else:
-                            #logger.debug(f"(lnum+1-num): {lnum+1-num}")
-                            lnum += 1
-                            new_flvalue = f"{flvalue[0:2]}{lnum}"
-                            fl.replace(f'{i}.0', f'{i}.end', new_flvalue)
-                            
-                if need_change_tag:
-                    tags = judge_tag(flvalue)
-                    if 'arrowline' in tags:
-                        found_arrow_count = 1
-                        merge_tag, tmp, block_end = get_merge_tag(i)
-                        logger.debug(f"{i}行merge_tag: {merge_tag} block_end: {block_end}")
-                        if merge_tag: fl.tag_delete(merge_tag)
-                        fl.delete(f"{i}.0", f"{i}.end")
-                        
-                        if 'spacesimage' in tags:
-                            hand_op_func(i, 'spacesimage')
-                        else: hand_op_func(i, 'othertag')
-                    elif found_arrow_count == 1:
-                        need_change_tag = False
-                        if 'equalline' not in tags: has_closed = True
-                        hand_op_func(i, 'equalline')
-                        hand_op_func(i+1, 'endline')
-                    elif 'equalline' in tags:
-                        block_end = f"{i-1}.end"
-                        if i != begin: has_closed = True
-                        need_change_tag = False
-                        hand_op_func(begin, 'equalline')
-                        hand_op_func(begin+1, 'endline')
-                if not need_change_num and not need_change_tag:
-                    end_line = i
-                    break
-            hand_op_func(end_line, 'endline')
-                    
-        def generate_file_numbers(line: int, tag, *args):
-            nonlocal pre_line, has_arrow, has_closed, act_num, block_start, block_end, pre_tag, merge_tag_count
-            
-            if tag == 'continue':
-                handle_non_modify(line, generate_file_numbers, *args)
-                
-            if MERGE_TAG_LOG:
-                logger.debug("------------")
-                logger.debug(f"{direction}--line: {line} tag: {tag} act_num: {act_num} pre_tag: {pre_tag} has_arrow: {has_arrow}")
-                
-            if not pre_line:
-                pre_line = line
-                pre_tag = tag
-                return
-
-            if tag == 'equalline' and pre_tag != 'equalline':
-                if has_arrow:
-                    if not has_closed:
-                        pre_str = '|_'
-                        has_closed = True
-                    if block_end == None: block_end = f"{pre_line}.end"
-                else:
-                    pre_str = arrow
-                    block_start = f"{pre_line}.0"
-                    if block_end == None: block_end = f"{pre_line}.end"
-                    has_arrow = True
-                    has_closed = True
-            elif pre_tag == 'equalline':
-                pre_str = '  '
-            else:
-                if has_arrow:
-                    pre_str = '| '
-                else:
-                    pre_str = arrow
-                    block_start = f"{pre_line}.0"
-                    has_arrow = True
-                    
-            if pre_tag != 'spacesimage': 
-                act_num += 1
-                end_str = f"{act_num}\n"
-            else:
-                end_str = f" \n"
-
-            if MERGE_TAG_LOG:
-                logger.debug(f"{pre_line}.0 insert: {repr(pre_str)}{repr(end_str)}")
-                
+    def display_gutters(lfl, rfl, rows, blocks):
+        """
+        由显示行模型（diff_model.build_rows / merge_blocks）整体重写左右文件行号栏：
+        实际行号、箭头行在 Python 中算好，每个控件一次 insert，合并块各加一个标签
+        """
+        for fl, side in ((lfl, 'left'), (rfl, 'right')):
+            prestate = fl.cget('state')
             fl.config(state='normal')
-            if tag != 'endline':
-                if arrow in pre_str:
-                    fl.insert(f"{pre_line}.0", f"{pre_str}{end_str}", "arrow_merge")
-                    #insert_and_tags(fl, f"{pre_line}.0", f"{pre_str}{end_str}", "arrow_merge")
-                else:
-                    fl.insert(f"{pre_line}.0", f"{pre_str}{end_str}")
-                    #insert_and_tags(fl, f"{pre_line}.0", f"{pre_str}{end_str}")
-            
-            if MERGE_TAG_LOG:
-                logger.debug(f"has_arrow: {has_arrow} has_closed: {has_closed}")
-                
-            if tag == 'equalline' and has_arrow and has_closed:
-                has_closed = False
-                has_arrow = False
-                block_end = None
-                merge_tag_count += 1
-                merge_tag = f"merge{merge_tag_count}"
-                if MERGE_TAG_LOG:
-                    logger.debug(f"merge_tag: {merge_tag} block_start: {block_start} block_end: {block_end}")
-                fl.tag_add(merge_tag, block_start, block_end)
-            elif tag == 'endline':
-                cursor = fl.index(INSERT)
-                fl.delete(cursor)
-                
-            pre_line = line
-            pre_tag = tag
-            
-            fl.config(state='disabled')
-            
-        return generate_file_numbers
+            fl.delete('1.0', 'end')
+            runs = gutter_runs(rows, blocks, side)
+            if runs:
+                fl.insert('1.0', *runs)
+            tag_merge_blocks(fl, blocks, 0, len(rows))
+            fl.config(state=prestate)
 
     @staticmethod
     def refresh_compare_F5(text_area, event, argsdict):
         logger.debug(f"refresh 事件触发")
         workspace_instance = argsdict.get('workspace')  # 确保传入了 workspace 实例
-        if workspace_instance.is_refreshing:
-            logger.debug("刷新对比已在进行中，忽略重复触发")
-            return
 
         text_area = argsdict.get("textarea")
         tag_area = argsdict.get("tagarea")
@@ -510,6 +377,9 @@ class Workspace:
                 message=msg
             )
         """        
+        if Editor.is_loading(text_area) or Editor.is_loading(tag_area):
+            argsdict.get('statusbar').set("文件正在加载，加载完成后再刷新对比")
+            return
         if workspace_instance:
             workspace_instance.start_async_refresh(
                 text_area=text_area,
@@ -520,13 +390,23 @@ class Workspace:
             )
 
     def start_async_refresh(self, text_area, tag_area, text_line_numbers, tag_line_numbers, lfl, rfl):
-        """启动异步刷新任务"""
+        """启动异步刷新任务；已有对比在进行时取消它，由本次对比取代"""
         if self.is_refreshing:
-            return  # 防止重复执行
+            self.compare_cancel.set()
+            logger.debug(f"取消第 {self.compare_generation} 次对比，由新的刷新取代")
 
         self.is_refreshing = True
+        self.compare_generation += 1
+        generation = self.compare_generation
+        cancel = self.compare_cancel = threading.Event()
+        self.refresh_areas = (text_area, tag_area)
         self.statusvar.set("正在刷新对比...")
 
+        # 上次的结果还在分片显示时取消，控件中只有部分行：直接使用该结果的两侧内容，不做增量对比
+        pending = self.cancel_render()
+        if pending:
+            self.compare_snapshot = None
+
         # === 主线程：更新 UI 表示正在刷新 ===
         for widget in [text_area, tag_area]:
             widget.config(cursor="wait")
@@ -541,15 +421,24 @@ class Workspace:
         clear_event_queue(text_area.__dict__.get('__eventqueue'))
         clear_event_queue(tag_area.__dict__.get('__eventqueue'))        
 
-        # 获取文本内容（也可以放子线程）
-        left_content = Editor.get_area(text_area)
-        right_content = Editor.get_area(tag_area)
+        # 获取文本内容：有文档模型时在主线程只复制模型，由子线程生成内容；
+        # 虚拟视图的控件中只有部分行，直接取视图中的内容
+        documents = None
+        if pending:
+            left_content, right_content = pending['lines']
+        elif self.diff_view:
+            left_content, right_content = self.diff_view.lines1, self.diff_view.lines2
+        elif DocumentModel.of(text_area) and DocumentModel.of(tag_area):
+            documents = (DocumentModel.of(text_area).copy(), DocumentModel.of(tag_area).copy())
+        else:
+            left_content = Editor.get_area(text_area)
+            right_content = Editor.get_area(tag_area)
         
         # 保存滚动位置和光标位置
         try:
             # 获取文本区域的滚动位置
             scroll_x = text_area.xview()[0]
-            scroll_y = text_area.yview()[0]
+            scroll_y = (self.diff_view or text_area).yview()[0]
             # 获取光标位置
             cursor_pos = text_area.index("insert")
             # 保存这些位置信息
@@ -562,29 +451,57 @@ class Workspace:
             logger.error(f"保存位置信息失败: {e}")
             position_info = None
 
+        snapshot = self.compare_snapshot
+
+        def progress(stage, done, total, metrics=None):
+            self.post_compare_message({
+                'status': 'progress',
+                'generation': generation,
+                'data': (stage, done, total, metrics)
+            })
+
         # === 子线程执行耗时操作 ===
         def worker():
+            nonlocal left_content, right_content
             try:
-                # 执行耗时的对比逻辑
-                logger.debug("后台线程开始执行 compare_files")
-                match_pairs = compare_files(left_content, right_content)
+                if documents:
+                    left_content, right_content = (document.content() for document in documents)
+
+                # 执行耗时的对比逻辑：有上次的快照时只重新对齐变化的区间
+                splice = None
+                if snapshot:
+                    logger.debug("后台线程开始执行 incremental_compare")
+                    match_pairs, hashes, splice = incremental_compare(
+                        *snapshot['lines'], snapshot['match_pairs'],
+                        left_content, right_content, snapshot['hashes'], cancel=cancel, progress=progress)
+                else:
+                    logger.debug("后台线程开始执行 compare_files")
+                    match_pairs = compare_files(left_content, right_content, cancel=cancel, progress=progress)
+                    hashes = (line_hashes(left_content), line_hashes(right_content))
 
-                # 成功后将结果放入队列
-                self.refresh_queue.put({
+                # 成功后将结果交给主线程
+                self.post_compare_message({
                     'status': 'success',
+                    'generation': generation,
                     'data': {
                         'match_pairs': match_pairs,
+                        'hashes': hashes,
+                        'splice': splice,
+                        'snapshot': snapshot,
                         'left_content': left_content,
                         'right_content': right_content,
                         'widgets': (text_area, tag_area, text_line_numbers, tag_line_numbers, lfl, rfl),
                         'position_info': position_info
                     }
                 })
+            except CompareCancelled:
+                logger.debug(f"第 {generation} 次对比已取消")
             except Exception as e:
                 import traceback
                 error_msg = traceback.format_exc()
-                self.refresh_queue.put({
+                self.post_compare_message({
                     'status': 'error',
+                    'generation': generation,
                     'data': str(e),
                     'traceback': error_msg,
                     'widgets': (text_area, tag_area, text_line_numbers, tag_line_numbers, lfl, rfl)
@@ -593,19 +510,57 @@ class Workspace:
         thread = threading.Thread(target=worker, daemon=True)
         thread.start()
 
-        # 启动轮询检查结果
-        self.poll_refresh_result()
-
-    def poll_refresh_result(self):
-        """检查子线程是否返回结果"""
+    def cancel_compare(self):
+        """取消正在进行的后台对比并恢复文本区，返回是否有被取消的对比"""
+        if not self.is_refreshing:
+            return False
+        self.compare_cancel.set()
+        self.compare_generation += 1
+        self.is_refreshing = False
+        self.root.config(cursor="")
+        for widget in self.refresh_areas:
+            widget.config(cursor="", state='normal')
+        self.statusvar.set("对比已取消")
+        logger.debug("已取消正在进行的对比")
+        return True
+
+    def post_compare_message(self, message):
+        """（子线程调用）放入消息并产生虚拟事件，由主循环在 on_compare_message 中处理"""
+        self.refresh_queue.put(message)
         try:
-            while self.is_refreshing:
-                result = self.refresh_queue.get_nowait()
-                self.handle_refresh_result(result)
-        except:
-            # 队列为空，继续等待
-            if self.is_refreshing:
-                self.root.after(50, self.poll_refresh_result)  # 每 50ms 检查一次
+            self.root.event_generate(COMPARE_MESSAGE_EVENT, when='tail')
+        except (TclError, RuntimeError) as e:
+            # 主窗口已销毁或主循环已退出，消息无人处理
+            logger.debug(f"无法通知主线程: {e}")
+
+    def on_compare_message(self, event=None):
+        """处理后台对比的消息，丢弃已被取代或取消的对比的消息"""
+        while True:
+            try:
+                message = self.refresh_queue.get_nowait()
+            except queue.Empty:
+                return
+            if message['generation'] != self.compare_generation or not self.is_refreshing:
+                logger.debug(f"丢弃第 {message['generation']} 次对比的过期消息")
+                continue
+            if message['status'] == 'progress':
+                self.show_compare_progress(*message['data'])
+            else:
+                self.handle_refresh_result(message)
+
+    def show_compare_progress(self, stage, done, total, metrics=None):
+        if stage == 'matrix':
+            text = f"正在计算相似度 {done}/{total} 行"
+            if metrics:
+                self.compare_metrics = metrics
+                text += f"，{metrics['cells_per_sec']:,.0f} 单元格/秒"
+                if metrics['eta'] is not None and done < total:
+                    text += f"，预计剩余 {metrics['eta']:.0f} 秒"
+            self.statusvar.set(text + "...")
+        elif done < total:
+            self.statusvar.set(f"正在对齐 {done}/{total} 行...")
+        else:
+            self.statusvar.set("对齐完成，正在显示结果...")
 
     def handle_refresh_result(self, result):
         """处理刷新结果（在主线程执行）"""
@@ -614,7 +569,7 @@ class Workspace:
         self.root.config(cursor="")  # 恢复光标
 
         text_area, tag_area, text_line_numbers, tag_line_numbers, lfl, rfl = \
-            result['data']['widgets']
+            result['data']['widgets'] if result['status'] == 'success' else result['widgets']
 
         # 恢复子空间光标
         for widget in [text_area, tag_area]:
@@ -628,67 +583,228 @@ class Workspace:
 
         if result['status'] == 'success':
             data = result['data']
+            widgets = result['data']['widgets']
+            left_content, right_content = data['left_content'], data['right_content']
+            total_rows = len(left_content) + len(right_content) - len(data['match_pairs'])
+            virtual = bool(VIEW_VIRTUAL_MIN_ROWS) and total_rows >= VIEW_VIRTUAL_MIN_ROWS
+
+            if virtual or self.diff_view or not (
+                    data['splice'] and self.redraw_splice(data, text_area, tag_area, lfl, rfl)):
+                # 重置行号显示（轻量级操作，可放主线程）
+                Editor.line_number_reset(text_line_numbers)
+                Editor.line_number_reset(tag_line_numbers)
+                Editor.line_number_reset(lfl)
+                Editor.line_number_reset(rfl)
+
+                # 旧的虚拟视图不再使用，文档模型重新跟随控件
+                if self.diff_view:
+                    self.diff_view.detach()
+
+                # 重置文本区域（主线程）
+                Editor.text_area_reset(text_area)
+                Editor.text_area_reset(tag_area)
+                text_area.tag_delete(*text_area.tag_names())
+                tag_area.tag_delete(*tag_area.tag_names())
+
+                Editor.configure_tags(text_area)
+                Editor.configure_tags(tag_area)
+
+                self.diff_view = None
+                if virtual:
+                    # 只放入可见区域附近的行，结果只读
+                    self.diff_view = VirtualDiffView(
+                        (text_area, tag_area), (text_line_numbers, tag_line_numbers), (lfl, rfl),
+                        left_content, right_content, data['match_pairs']
+                    )
+                    self.diff_view.show(0)
+                    for widget in [text_area, tag_area]:
+                        widget.config(state='disabled')
+                else:
+                    # 分片显示结果，显示完成后再更新行号、恢复位置
+                    steps = Workspace.display_results_steps(
+                        text_area, tag_area,
+                        left_content, right_content,
+                        data['match_pairs'], lfl, rfl
+                    )
+                    self.start_render(steps, (left_content, right_content), (text_area, tag_area),
+                                      lambda: self.finish_refresh(data, widgets, virtual, total_rows))
+                    return
+
+            self.finish_refresh(data, widgets, virtual, total_rows)
+        else:
+            logger.error(f"刷新失败: {result['data']}\n{result.get('traceback', '')}")
+            messagebox.showerror("刷新错误", f"刷新失败：{result['data']}")
 
-            # 重置行号显示（轻量级操作，可放主线程）
-            Editor.line_number_reset(text_line_numbers)
-            Editor.line_number_reset(tag_line_numbers)
-            Editor.line_number_reset(lfl)
-            Editor.line_number_reset(rfl)
-            
-            # 重置文本区域（主线程）
-            Editor.text_area_reset(text_area)
-            Editor.text_area_reset(tag_area)
-            text_area.tag_delete(*text_area.tag_names())
-            tag_area.tag_delete(*tag_area.tag_names())
-
-            Editor.configure_tags(text_area)
-            Editor.configure_tags(tag_area)
-
-            # 显示结果（确保此方法是线程安全的，通常它是）
-            Workspace.display_results(
-                text_area, tag_area,
-                data['left_content'], data['right_content'],
-                data['match_pairs'], lfl, rfl
-            )
+    def finish_refresh(self, data, widgets, virtual, total_rows):
+        """结果显示完成后：保存对比快照、更新行号、恢复滚动与光标位置"""
+        text_area, tag_area, text_line_numbers, tag_line_numbers, lfl, rfl = widgets
+        left_content, right_content = data['left_content'], data['right_content']
+        self.compare_snapshot = {
+            'lines': (left_content, right_content),
+            'hashes': data['hashes'],
+            'match_pairs': data['match_pairs'],
+            'rows': total_rows
+        }
 
-            # 更新行号
+        # 更新行号；虚拟视图的行号随窗口一起放入
+        if virtual:
+            self.statusvar.set(f"对比刷新完成，共 {total_rows} 行，已启用虚拟滚动显示，两侧文本区只读不可编辑")
+        else:
+            self.statusvar.set("对比刷新完成")
             Editor.update_line_numbers(text_area, text_line_numbers, tag_line_numbers)
-            
-            # 恢复滚动位置和光标位置
-            position_info = data.get('position_info')
-            if position_info:
-                try:
-                    # 延迟一小段时间确保UI完全更新
-                    def restore_position():
-                        try:
-                            # 恢复滚动位置
-                            if 'scroll_x' in position_info and 'scroll_y' in position_info:
-                                text_area.xview_moveto(position_info['scroll_x'])
+
+        # 恢复滚动位置和光标位置
+        position_info = data.get('position_info')
+        if position_info:
+            try:
+                # 延迟一小段时间确保UI完全更新
+                def restore_position():
+                    try:
+                        # 恢复滚动位置
+                        if 'scroll_x' in position_info and 'scroll_y' in position_info:
+                            text_area.xview_moveto(position_info['scroll_x'])
+                            if self.diff_view:
+                                self.diff_view.scroll('moveto', position_info['scroll_y'])
+                            else:
                                 text_area.yview_moveto(position_info['scroll_y'])
-                            
-                            # 恢复光标位置，先检查位置是否有效
-                            if 'cursor_pos' in position_info:
-                                try:
-                                    # 尝试移动光标，如果位置无效则不处理
-                                    text_area.mark_set("insert", position_info['cursor_pos'])
-                                except TclError:
-                                    # 位置无效，不做处理
-                                    pass
-                            
-                            # 设置焦点到文本区域
-                            text_area.focus_set()
-                        except Exception as e:
-                            logger.error(f"恢复位置信息失败: {e}")
-                    
-                    # 使用after来确保在UI更新完成后执行
-                    self.root.after(100, restore_position)
-                except Exception as e:
-                    logger.error(f"调度恢复位置失败: {e}")
-
-            logger.debug("异步刷新完成")
-        else:
-            logger.error(f"刷新失败: {result['data']}\n{result.get('traceback', '')}")
-            messagebox.showerror("刷新错误", f"刷新失败：{result['data']}")
+
+                        # 恢复光标位置，先检查位置是否有效
+                        if 'cursor_pos' in position_info:
+                            try:
+                                # 尝试移动光标，如果位置无效则不处理
+                                text_area.mark_set("insert", position_info['cursor_pos'])
+                            except TclError:
+                                # 位置无效，不做处理
+                                pass
+
+                        # 设置焦点到文本区域
+                        text_area.focus_set()
+                    except Exception as e:
+                        logger.error(f"恢复位置信息失败: {e}")
+
+                # 使用after来确保在UI更新完成后执行
+                self.root.after(100, restore_position)
+            except Exception as e:
+                logger.error(f"调度恢复位置失败: {e}")
+
+        logger.debug("异步刷新完成")
+
+    def start_render(self, steps, lines, text_areas, on_done):
+        """
+        分片执行显示任务 steps（生成器，每步 yield (已显示行数, 总行数)）：
+        每片最多 VIEW_RENDER_SLICE_MS 毫秒，片间通过 root.after 让出主循环，状态栏显示进度。
+        显示期间文本区不可编辑，完成后调用 on_done
+        """
+        self.cancel_render()
+        self.render_job = {
+            'steps': steps,
+            'lines': lines,
+            'text_areas': text_areas,
+            'on_done': on_done,
+            'after_id': None
+        }
+        self._render_slice()
+
+    def _render_slice(self):
+        job = self.render_job
+        if job is None:
+            return
+        job['after_id'] = None
+        deadline = time.perf_counter() + VIEW_RENDER_SLICE_MS / 1000
+        for area in job['text_areas']:
+            area.config(state='normal')
+        try:
+            while True:
+                done, total = next(job['steps'])
+                if time.perf_counter() >= deadline:
+                    break
+        except StopIteration:
+            self.render_job = None
+            job['on_done']()
+            return
+        except Exception as e:
+            # 控件中只有部分结果，与上次的对比快照不再对应，下次刷新整体重绘；不向 after 回调抛出
+            self.render_job = None
+            self.compare_snapshot = None
+            self.statusvar.set("显示对比结果失败")
+            logger.error(f"显示对比结果失败: {e}", exc_info=True)
+            messagebox.showerror("刷新错误", f"显示对比结果失败：{e}")
+            return
+
+        for area in job['text_areas']:
+            area.config(state='disabled')
+        self.statusvar.set(f"正在显示对比结果 {done}/{total} 行...")
+        job['after_id'] = self.root.after(1, self._render_slice)
+
+    def cancel_render(self, restore=True):
+        """取消正在进行的分片显示，返回被取消的任务；restore 为 True 时恢复文本区可编辑"""
+        job, self.render_job = self.render_job, None
+        if job is None:
+            return None
+        if job['after_id']:
+            try:
+                self.root.after_cancel(job['after_id'])
+            except TclError:
+                pass
+        job['steps'].close()
+        if restore:
+            for area in job['text_areas']:
+                area.config(state='normal')
+        logger.debug("已取消正在进行的结果显示")
+        return job
+
+    def redraw_splice(self, data, text_area, tag_area, lfl, rfl):
+        """
+        增量对比结果只重绘变化区间对应的显示行，返回 False 时由调用方整体重绘。
+        每个行对占一行、未匹配的行各占一行，所以 x 行对 y 行、含 k 个行对的区间显示 x+y-k 行
+        """
+        snapshot = data['snapshot']
+        if snapshot is not self.compare_snapshot:
+            return False
+        a1, a2, b1, b2, new_b1, new_b2 = data['splice']
+        old_pairs, match_pairs = snapshot['match_pairs'], data['match_pairs']
+
+        head = bisect_left(old_pairs, (a1,))
+        old_middle = bisect_left(old_pairs, (b1,)) - head
+        new_middle = bisect_left(match_pairs, (new_b1,)) - head
+        start_row = a1 + a2 - head
+        old_rows = (b1 - a1) + (b2 - a2) - old_middle
+        total_rows = snapshot['rows']
+        if start_row == 0 and start_row + old_rows == total_rows:
+            return False
+
+        # 文本区中用户编辑增减的行数：当前行数减去上次显示结束（含填充行）时的行数
+        deltas = []
+        for area in (text_area, tag_area):
+            endline = area.__dict__.get('__endline')
+            if endline is None:
+                return False
+            delta = int(area.index('end').split('.')[0]) - endline
+            if old_rows + delta < 0:
+                return False
+            deltas.append(delta)
+
+        # 先删除末尾的填充行，再删除变化区间的旧显示行；文件行号栏随后按完整结果整体重写
+        for widget, delta in zip((text_area, tag_area), deltas):
+            prestate = widget.cget('state')
+            widget.config(state='normal')
+            widget.delete(f"{total_rows + delta + 1}.0", 'end')
+            widget.delete(f"{start_row + 1}.0", f"{start_row + old_rows + delta + 1}.0")
+            widget.config(state=prestate)
+
+        middle = [
+            (i - a1, j - a2, *rest)
+            for i, j, *rest in match_pairs[head:head + new_middle]
+        ]
+        logger.debug(f"增量重绘: 第 {start_row + 1} 行起 {old_rows} 行替换为 {new_b1 - a1 + new_b2 - a2 - new_middle} 行")
+        Workspace.display_results(
+            text_area, tag_area,
+            data['left_content'][a1:new_b1], data['right_content'][a2:new_b2],
+            middle, None, None, start_line=start_row + 1
+        )
+        rows = build_rows(match_pairs, len(data['left_content']), len(data['right_content']))
+        Workspace.display_gutters(lfl, rfl, rows, merge_blocks(rows))
+        return True
 
     """
     left_text_area: 被修改区域text控件
@@ -697,150 +813,43 @@ class Workspace:
     lines2：right_text_area区域内容，按行记录
     match_pairs：对比算法（compare_files）对比内容后返回的结果
     lfl: 显示左边区域文件内容实际行数及合并标记的控件
-    lfl: 显示右边区域文件内容实际行数及合并标记的控件
+    lfl: 显示右边区域文件内容实际行数及合并标记的控件，二者按本次显示的行整体重写；
+         只重绘部分行时传入 None，由调用方按完整结果调用 display_gutters
     start_line：在text控件中开始插入的行。控件的行数从1开始计数
     """
     @staticmethod
     def display_results(left_text_area, right_text_area, lines1, lines2, match_pairs, 
                         lfl, rfl, start_line=1):
         """在 GUI 中显示对比结果"""
-        # 初始化行号
-        left_line = 0
-        right_line = 0
-        area_line = start_line
-
-        lfl_func = Workspace.create_fileline_handler(lfl, None, start_line)
-        rfl_func = Workspace.create_fileline_handler(None, rfl, start_line)
-        
-        for pair in match_pairs:
-            # 处理未匹配的行
-            while left_line < pair[0]:
-                left_text_area.insert(f"{area_line}.0", lines1[left_line], ("uniqline", "textcontent"))
-                #left_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-                #left_text_area.tag_add('textcontent', f'{area_line}.0', f"{area_line}.end")
-                lfl_func(area_line, "textcontent")
-
-                right_text_area.insert(f"{area_line}.0", "\n", ("uniqline", "spacesimage"))
-                #right_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-                #right_text_area.tag_add('spacesimage', f'{area_line}.0', f"{area_line}.end")
-                rfl_func(area_line, "spacesimage")
-                
-                left_line += 1
-                area_line += 1
-                
-            while right_line < pair[1]:
-                left_text_area.insert(f"{area_line}.0", "\n", ("uniqline", "spacesimage"))
-                #left_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-                #left_text_area.tag_add('spacesimage', f'{area_line}.0', f"{area_line}.end")
-                lfl_func(area_line, "spacesimage")
-                
-                right_text_area.insert(f"{area_line}.0", lines2[right_line], ("uniqline", "textcontent"))
-                #right_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-                #right_text_area.tag_add('textcontent', f'{area_line}.0', f"{area_line}.end")
-                rfl_func(area_line, "textcontent")
-                
-                right_line += 1
-                area_line += 1
-
-            # 处理匹配的行
-            left_line_text = lines1[left_line]
-            right_line_text = lines2[right_line]
-            match_ratio = pair[5]  # 匹配度
-
-            if abs(match_ratio-MatcherConfig.SCALE) > MatcherConfig.MIN_RATIO:
-                # 提取不同字符并标记为红色
-                matcher = mySequenceMatcher(lambda c: c in set(JUNK_STR_PATTERN) , left_line_text, right_line_text, process=False)
-                left_diff_indices = []
-                right_diff_indices = []
-
-                for tag in matcher.get_opcodes():
-                    op, i1, i2, j1, j2 = tag
-                    if op == 'replace' or op == 'delete':
-                        left_diff_indices.append((i1, i2))
-                    if op == 'replace' or op == 'insert':
-                        right_diff_indices.append((j1, j2))
-                
-                if repr(left_line_text) == repr('\n'):
-                    left_text_area.insert(f"{area_line}.0", "\n", ("somematch"))
-                else:
-                    # 插入左侧文本，标记不同字符为红色
-                    left_start = 0
-                    index = f"{area_line}.0"
-                    for start, end in left_diff_indices:
-                        left_text_area.insert(index, left_line_text[left_start:start], 'somematch')
-                        left_text_area.insert(f"{area_line}.{start}", left_line_text[start:end], ('somematch', "linediffer"))
-                        left_start = end
-                        index = f"{area_line}.{end}"
-                    left_text_area.insert(f"{area_line}.{left_start}", left_line_text[left_start:], 'somematch')
-                #left_text_area.tag_add('somematch', f'{area_line}.0', f"{area_line}.end")
-                lfl_func(area_line, "somematch")
-                
-                if repr(right_line_text) == repr('\n'):
-                    right_text_area.insert(f"{area_line}.0", "\n", ("somematch"))
-                else:
-                    # 插入右侧文本，标记不同字符为红色
-                    right_start = 0
-                    index = f"{area_line}.0"
-                    for start, end in right_diff_indices:
-                        right_text_area.insert(index, right_line_text[right_start:start], 'somematch')
-                        right_text_area.insert(f"{area_line}.{start}", right_line_text[start:end], ('somematch', "linediffer"))
-                        right_start = end
-                        index = f"{area_line}.{end}"
-                    right_text_area.insert(f"{area_line}.{right_start}", right_line_text[right_start:], 'somematch')
-                #right_text_area.tag_add('somematch', f'{area_line}.0', f"{area_line}.end")
-                rfl_func(area_line, "somematch")
-
-            else:
-                # 完全匹配的行
-                left_text_area.insert(f"{area_line}.0", left_line_text, ('equalline'))
-                #left_text_area.tag_add('equalline', f'{area_line}.0', f"{area_line}.end")
-                lfl_func(area_line, "equalline")
-                
-                right_text_area.insert(f"{area_line}.0", right_line_text, ('equalline'))
-                #right_text_area.tag_add('equalline', f'{area_line}.0', f"{area_line}.end")
-                rfl_func(area_line, "equalline")
-
-            left_line += 1
-            right_line += 1
-            area_line += 1
-
-        # 处理剩余未匹配的行
-        while left_line < len(lines1):
-            left_text_area.insert(f"{area_line}.0", lines1[left_line], ("uniqline", "textcontent"))
-            #left_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-            #left_text_area.tag_add('textcontent', f'{area_line}.0', f"{area_line}.end")
-            lfl_func(area_line, "textcontent")
-            
-            right_text_area.insert(f"{area_line}.0", "\n", ("uniqline", "spacesimage"))
-            #right_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-            #right_text_area.tag_add('spacesimage', f'{area_line}.0', f"{area_line}.end")
-            rfl_func(area_line, "spacesimage")
-            
-            left_line += 1
-            area_line += 1
-        while right_line < len(lines2):
-            left_text_area.insert(f"{area_line}.0", "\n", ("uniqline", "spacesimage"))
-            #left_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-            #left_text_area.tag_add('spacesimage', f'{area_line}.0', f"{area_line}.end")
-            lfl_func(area_line, "spacesimage")
-            
-            right_text_area.insert(f"{area_line}.0", lines2[right_line], ("uniqline", "textcontent"))
-            #right_text_area.tag_add('uniqline', f'{area_line}.0', f"{area_line}.end")
-            #right_text_area.tag_add('textcontent', f'{area_line}.0', f"{area_line}.end")
-            rfl_func(area_line, "textcontent")
-            
-            right_line += 1
-            area_line += 1
-        
-        end_line = int(right_text_area.index('end-1c').split('.')[0])
-        logger.debug(f"++++end_line: {end_line} area_line: {area_line}+++")
-        if area_line == end_line:
-            lfl_func(area_line, "equalline")
-            rfl_func(area_line, "equalline")
-            lfl_func(area_line+1, "endline")
-            rfl_func(area_line+1, "endline")
-        else:
-            newlins = area_line-start_line
-            lfl_func(area_line, "continue", end_line)
-            rfl_func(area_line, "continue", end_line)
+        for _ in Workspace.display_results_steps(left_text_area, right_text_area, lines1, lines2,
+                                                 match_pairs, lfl, rfl, start_line):
+            pass
 
+    @staticmethod
+    def display_results_steps(left_text_area, right_text_area, lines1, lines2, match_pairs,
+                              lfl, rfl, start_line=1):
+        """
+        分步显示对比结果，每插入一批行 yield (已显示行数, 总行数)。
+        每行的文本片段与标签在 Python 中算好（diff_model.row_runs），每 VIEW_INSERT_BATCH_ROWS 行
+        合并为一次多片段的 insert(index, 文本, 标签, 文本, 标签, ...) 调用；文件行号栏在最后一次写入
+        """
+        rows = build_rows(match_pairs, len(lines1), len(lines2))
+        inserts = 0
+        for batch_start in range(0, len(rows), VIEW_INSERT_BATCH_ROWS):
+            batch = rows[batch_start:batch_start + VIEW_INSERT_BATCH_ROWS]
+            left_runs, right_runs = [], []
+            for row in batch:
+                left, right = row_runs(row, lines1, lines2)
+                left_runs += left
+                right_runs += right
+
+            index = f"{start_line + batch_start}.0"
+            for text_area, runs in ((left_text_area, left_runs), (right_text_area, right_runs)):
+                if runs:
+                    text_area.insert(index, *runs)
+                    inserts += 1
+            yield batch_start + len(batch), len(rows)
+        logger.debug(f"display_results: {len(rows)} 行，文本区 insert 调用 {inserts} 次")
+
+        if lfl is not None and rfl is not None:
+            Workspace.display_gutters(lfl, rfl, rows, merge_blocks(rows))